@@ -0,0 +1,112 @@
+# app_tier_image.py
+
+from config import (
+    REMOTE_APP_DIR, GIT_REPO_URL, CLASSIFIER_BACKEND, APP_READY_MARKER_ENV
+)
+
+# Loads the classifier once, which downloads and caches the model weights on the instance
+CACHE_MODEL_COMMAND = f'{REMOTE_APP_DIR}/venv/bin/python3 -c "from image_classification import ImageClassifier; ImageClassifier()"'
+
+
+def install_script():
+    """
+    Returns the shell commands that install the App Tier on a fresh Ubuntu instance: the necessary packages,
+    the classifier repo, a venv with torch, and the app_tier_worker pool as a systemd service.
+    The service is left disabled, so a baked image doesn't start workers on its own; app_user_data() enables it.
+    """
+    # The onnxruntime backend needs the runtime and the exported model on the instance
+    onnx_setup = ""
+    if CLASSIFIER_BACKEND == 'onnxruntime':
+        onnx_setup = "pip install onnxruntime\npython3 export_onnx.py"
+
+    return f"""cd /home/ubuntu
+apt update -y
+apt install python3 -y
+apt install python3-pip -y
+apt install python3-venv -y
+apt install git -y
+
+mkdir -p {REMOTE_APP_DIR}
+cd {REMOTE_APP_DIR}
+git clone {GIT_REPO_URL} .
+
+python3 -m venv venv
+source venv/bin/activate
+pip install --upgrade pip
+pip install boto3
+pip install --break-system-packages torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cpu
+{onnx_setup}
+
+# The App Tier worker pool (one or more workers, sized to the instance's cores) runs as a service
+cat << 'EOF_UNIT' > /etc/systemd/system/app-tier-worker.service
+[Unit]
+Description=App Tier worker pool
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+WorkingDirectory={REMOTE_APP_DIR}
+ExecStart={REMOTE_APP_DIR}/venv/bin/python3 app_tier_supervisor.py
+Restart=always
+RestartSec=5
+StandardOutput=append:{REMOTE_APP_DIR}/app_tier_worker.log
+StandardError=append:{REMOTE_APP_DIR}/app_tier_worker.log
+
+[Install]
+WantedBy=multi-user.target
+EOF_UNIT
+systemctl daemon-reload"""
+
+def app_user_data(key_content, baked=False, warm_pool=False, ready_marker=False):
+    """
+    Returns the user data script of an App Tier instance.
+    baked: the instance boots from an image made by the bake step of setup_aws.py, which already has
+    everything from install_script() and the model weights, so the script only writes key.py and starts the worker.
+    warm_pool: the instance is initialised for the warm pool: it enables the worker service (so it starts when the
+    instance is started again), caches the model weights and powers off (a stopped, ready instance) instead of starting the worker.
+    ready_marker: the worker writes a ready marker to S3 once its model is loaded (only the bake step's test instance).
+    """
+    if warm_pool:
+        start_worker = f"""# Load the model once so its weights are cached on disk, then stop: the instance waits in the warm pool
+systemctl enable app-tier-worker.service
+{CACHE_MODEL_COMMAND}
+echo "Warm pool instance initialised. Stopping."
+shutdown -h now"""
+    else:
+        start_worker = 'systemctl enable --now app-tier-worker.service\necho "App tier worker started."'
+
+    marker_setup = ""
+    if ready_marker:
+        marker_setup = f"""mkdir -p /etc/systemd/system/app-tier-worker.service.d
+cat << 'EOF_MARKER' > /etc/systemd/system/app-tier-worker.service.d/ready-marker.conf
+[Service]
+Environment={APP_READY_MARKER_ENV}=1
+EOF_MARKER
+systemctl daemon-reload"""
+
+    return f"""#!/bin/bash
+sudo -i
+{'' if baked else install_script()}
+{marker_setup}
+cd {REMOTE_APP_DIR}
+
+cat << 'EOF_CONFIG' > key.py
+{key_content}
+EOF_CONFIG
+
+{start_worker}
+"""
+
+def builder_user_data():
+    """
+    Returns the user data script of the image builder instance: it installs the App Tier, caches the
+    model weights and powers off, ready to be snapshotted. No credentials are written into the image.
+    """
+    return f"""#!/bin/bash
+sudo -i
+{install_script()}
+{CACHE_MODEL_COMMAND}
+rm -f {REMOTE_APP_DIR}/app_tier_worker.log
+echo "App Tier image builder finished. Stopping."
+shutdown -h now
+"""
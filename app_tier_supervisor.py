@@ -0,0 +1,161 @@
+# app_tier_supervisor.py
+
+import os
+import sys
+import time
+import signal
+import logging
+import multiprocessing
+
+from config import (
+    APP_WORKER_PROCESSES, APP_TORCH_THREADS_PER_WORKER,
+    APP_WORKER_HEARTBEAT_TIMEOUT, APP_SUPERVISOR_CHECK_INTERVAL
+)
+
+# Set up logging to console (no file logging as per requirement)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Workers are started with 'spawn' so each child initialises its inference thread pools itself
+# instead of inheriting a forked copy of the supervisor's state.
+mp_context = multiprocessing.get_context('spawn')
+
+
+def compute_worker_layout(cpu_count, worker_processes=APP_WORKER_PROCESSES, threads_per_worker=APP_TORCH_THREADS_PER_WORKER):
+    """
+    Splits the CPU cores between worker processes and inference (intra-op) threads.
+    Returns (number_of_workers, threads_per_worker).
+    A value of 0 for either setting means "auto-detect":
+    - both auto: 1 worker on 1-3 cores, otherwise one worker per 2 cores with 2 threads each
+    - only one set: the other is derived so that workers * threads == cpu_count
+    """
+    cpu_count = max(1, cpu_count)
+    if worker_processes > 0 and threads_per_worker > 0:
+        return worker_processes, threads_per_worker
+    if worker_processes > 0:
+        return worker_processes, max(1, cpu_count // worker_processes)
+    if threads_per_worker > 0:
+        return max(1, cpu_count // threads_per_worker), threads_per_worker
+    if cpu_count < 4:
+        return 1, cpu_count
+    return cpu_count // 2, 2
+
+def run_worker(slot, threads, cores, heartbeats, processed):
+    """Entry point of a worker process: pins it to its cores and runs the worker loop with `threads` inference threads."""
+    if cores and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            logging.warning(f"Worker {slot}: could not set CPU affinity to {cores}: {e}")
+
+    import app_tier_worker
+
+    def heartbeat(handled):
+        heartbeats[slot] = time.time()
+        with processed.get_lock():
+            processed[slot] += handled
+
+    logging.info(f"Worker {slot} (PID {os.getpid()}) starting with {threads} inference thread(s) on cores {sorted(cores) if cores else 'any'}.")
+    app_tier_worker.main(heartbeat=heartbeat, inference_threads=threads)
+
+
+class WorkerSupervisor:
+    """Runs a pool of app tier worker processes, reports their health and restarts crashed or hung workers."""
+
+    def __init__(self, worker_count, threads_per_worker):
+        self.worker_count = worker_count
+        self.threads_per_worker = threads_per_worker
+        self.processes = [None] * worker_count
+        self.start_times = [0.0] * worker_count
+        self.restarts = [0] * worker_count
+        # Shared per-slot state written by the workers
+        self.heartbeats = mp_context.Array('d', worker_count)
+        self.processed = mp_context.Array('l', worker_count)
+        self.running = True
+
+    def cores_for_slot(self, slot):
+        """Returns the set of CPU cores assigned to a worker slot, or None if there aren't enough cores to pin."""
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        start = slot * self.threads_per_worker
+        cores = available[start:start + self.threads_per_worker]
+        if len(cores) < self.threads_per_worker:
+            return None
+        return set(cores)
+
+    def start_worker(self, slot):
+        """Starts (or restarts) the worker process for a slot."""
+        self.heartbeats[slot] = time.time() # Give the new worker a full timeout to load the model
+        process = mp_context.Process(
+            target=run_worker,
+            args=(slot, self.threads_per_worker, self.cores_for_slot(slot), self.heartbeats, self.processed),
+            name=f"app-worker-{slot}",
+            daemon=True
+        )
+        process.start()
+        self.processes[slot] = process
+        self.start_times[slot] = time.time()
+        logging.info(f"Started worker {slot} with PID {process.pid}.")
+
+    def check_workers(self):
+        """Restarts workers that exited or stopped sending heartbeats, and logs a health report."""
+        now = time.time()
+        for slot, process in enumerate(self.processes):
+            heartbeat_age = now - self.heartbeats[slot]
+            if not process.is_alive():
+                logging.error(f"Worker {slot} (PID {process.pid}) exited with code {process.exitcode}. Restarting...")
+            elif heartbeat_age > APP_WORKER_HEARTBEAT_TIMEOUT:
+                logging.error(f"Worker {slot} (PID {process.pid}) sent no heartbeat for {heartbeat_age:.0f}s. Restarting...")
+                process.terminate()
+                process.join(10)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+            else:
+                logging.info(f"Worker {slot}: PID {process.pid}, alive, last heartbeat {heartbeat_age:.0f}s ago, processed {self.processed[slot]} message(s), restarts {self.restarts[slot]}.")
+                continue
+
+            self.restarts[slot] += 1
+            # Back off if the worker keeps crashing right after start (e.g., missing dependency)
+            if now - self.start_times[slot] < APP_SUPERVISOR_CHECK_INTERVAL:
+                time.sleep(min(60, 2 ** min(self.restarts[slot], 6)))
+            self.start_worker(slot)
+
+    def stop(self, *_):
+        """Stops the supervisor loop and terminates all workers."""
+        self.running = False
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(10)
+        logging.info("All workers stopped.")
+
+    def run(self):
+        """Starts all workers and supervises them until stopped."""
+        for slot in range(self.worker_count):
+            self.start_worker(slot)
+        while self.running:
+            time.sleep(APP_SUPERVISOR_CHECK_INTERVAL)
+            if self.running:
+                self.check_workers()
+
+
+def main():
+    """Starts the worker pool sized for this machine."""
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    worker_count, threads_per_worker = compute_worker_layout(cpu_count)
+    logging.info(f"App Tier supervisor starting {worker_count} worker(s) with {threads_per_worker} inference thread(s) each on {cpu_count} CPU core(s).")
+
+    supervisor = WorkerSupervisor(worker_count, threads_per_worker)
+
+    def handle_signal(signum, frame):
+        logging.info(f"Received signal {signum}. Shutting down workers...")
+        supervisor.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    supervisor.run()
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,16 @@
 import boto3
 import os
 import time
+import queue
 import logging
-import subprocess # To call the external image classification script
+import threading
+import urllib.request
+from botocore.config import Config
+
+from image_classification import ImageClassifier, list_images
+from sqs_batching import SqsBatcher
+from message_protocol import decode_request
+from cancellation import CancellationWatcher
 
 from key import (
     AWS_ACCESS_KEY_ID,
@@ -13,31 +21,68 @@ from key import (
 
 from config import (
     AWS_REGION,
-    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
-    REMOTE_APP_DIR
+    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
+    WORKER_MAX_BATCH_SIZE, WORKER_MAX_BATCH_WAIT,
+    WORKER_DOWNLOAD_THREADS, WORKER_UPLOAD_THREADS,
+    WORKER_MAX_IN_FLIGHT, WORKER_VISIBILITY_SAFETY_FACTOR,
+    WORKER_IN_MEMORY_IMAGES,
+    CLASSIFIER_SAMPLE_DIR, CLASSIFIER_PREPROCESS_TOLERANCE,
+    WORKER_SQS_BATCH_MAX_DELAY, WORKER_RESPONSE_BATCHER_IDLE_TIMEOUT,
+    WORKER_MAX_VISIBILITY_EXTENSION, WORKER_STATS_INTERVAL,
+    WORKER_CANCELLATION_POLL_INTERVAL,
+    APP_READY_MARKER_PREFIX, APP_READY_MARKER_ENV
 )
 
 # Set up logging to console (no file logging as per requirement)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Initialize AWS clients
+# The connection pools are sized for the pipeline's receiver, downloader and uploader threads
+# (plus the batchers' and the cancellation watcher's background threads)
+aws_client_config = Config(max_pool_connections=WORKER_DOWNLOAD_THREADS + WORKER_UPLOAD_THREADS + 3)
 s3 = boto3.client(
     's3',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=aws_client_config
 )
 sqs = boto3.client(
     'sqs',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=aws_client_config
 )
 
 # SQS Queue URLs (will be retrieved once)
 request_queue_url = None
 response_queue_url = None
 
+# Batchers for request deletes and visibility changes (created in main() once the queue URLs are known)
+delete_batcher = None
+visibility_batcher = None
+# Batchers for response sends, one per response queue (the shared one and each web node's own queue),
+# and when each was last used
+response_batchers = {}
+response_batchers_used_at = {}
+closed_response_batcher_counts = {'entries_sent': 0, 'api_calls': 0} # Totals of the closed batchers, for the stats
+response_batchers_lock = threading.Lock()
+
+# SQS error codes meaning a queue doesn't exist (e.g., the web node that sent a request has shut down)
+MISSING_QUEUE_ERROR_CODES = ('AWS.SimpleQueueService.NonExistentQueue', 'QueueDoesNotExist')
+
+# Watcher of the request cancellations published by the web tier (started in main())
+cancellation_watcher = CancellationWatcher(s3, S3_CONTROL_BUCKET, WORKER_CANCELLATION_POLL_INTERVAL)
+
+# In-process classifier engine (model and labels are loaded once, on first use)
+classifier = None
+
+# EC2 instance ID of this worker (set in main()); sent with every response so the web tier can measure boot latency
+instance_id = None
+# EC2 instance metadata service (IMDSv2)
+INSTANCE_METADATA_URL = 'http://169.254.169.254/latest'
+
 
 def get_queue_url(queue_name):
     """Retrieves the SQS queue URL for a given queue name."""
@@ -48,6 +93,32 @@ def get_queue_url(queue_name):
         logging.error(f"Failed to get SQS queue URL for {queue_name}: {e}")
         return None
 
+def get_instance_id():
+    """Returns this machine's EC2 instance ID from the instance metadata service, or None when not on EC2."""
+    try:
+        token_request = urllib.request.Request(
+            f"{INSTANCE_METADATA_URL}/api/token", method='PUT',
+            headers={'X-aws-ec2-metadata-token-ttl-seconds': '60'}
+        )
+        with urllib.request.urlopen(token_request, timeout=2) as response:
+            token = response.read().decode('ascii')
+        id_request = urllib.request.Request(
+            f"{INSTANCE_METADATA_URL}/meta-data/instance-id",
+            headers={'X-aws-ec2-metadata-token': token}
+        )
+        with urllib.request.urlopen(id_request, timeout=2) as response:
+            return response.read().decode('ascii')
+    except Exception as e:
+        logging.warning(f"Could not get the EC2 instance ID: {e}")
+        return None
+
+def mark_instance_ready():
+    """Writes this instance's ready marker to S3 (used by setup_aws.py to measure boot-to-ready time)."""
+    try:
+        s3.put_object(Bucket=S3_CONTROL_BUCKET, Key=f"{APP_READY_MARKER_PREFIX}{instance_id}", Body=str(time.time()).encode('utf-8'))
+    except Exception as e:
+        logging.warning(f"Could not write the ready marker of instance {instance_id}: {e}")
+
 def download_image_from_s3(s3_key, download_path):
     """Downloads an image from S3 to a local path."""
     try:
@@ -58,6 +129,17 @@ def download_image_from_s3(s3_key, download_path):
         logging.error(f"Error downloading {s3_key} from S3: {e}")
         return False
 
+def download_image_bytes_from_s3(s3_key):
+    """Downloads an image from S3 into memory. Returns the raw bytes, or None on failure."""
+    try:
+        response = s3.get_object(Bucket=S3_INPUT_BUCKET, Key=s3_key)
+        image_bytes = response['Body'].read()
+        logging.info(f"Downloaded s3://{S3_INPUT_BUCKET}/{s3_key} into memory ({len(image_bytes)} bytes)")
+        return image_bytes
+    except Exception as e:
+        logging.error(f"Error downloading {s3_key} from S3: {e}")
+        return None
+
 def upload_result_to_s3(output_s3_key, result_text_content):
     """
     Uploads the image recognition result to S3.
@@ -72,56 +154,546 @@ def upload_result_to_s3(output_s3_key, result_text_content):
         logging.error(f"Error uploading result for {output_s3_key} to S3: {e}")
         return False
 
-def send_response_to_sqs(original_filename, prediction_result, unique_request_id):
-    """Sends the prediction result to the response SQS queue."""
-    global response_queue_url
-    if not response_queue_url:
-        response_queue_url = get_queue_url(RESPONSE_SQS_QUEUE_NAME)
-        if not response_queue_url:
-            logging.error("Response SQS queue URL not available. Cannot send response.")
-            return False
-    
+def get_response_batcher(queue_url):
+    """
+    Returns the send batcher of a response queue, creating it on first use.
+    Batchers of queues not used for WORKER_RESPONSE_BATCHER_IDLE_TIMEOUT seconds (e.g., of web nodes that
+    have restarted) are closed, so their flush threads don't pile up.
+    """
+    now = time.time()
+    with response_batchers_lock:
+        for idle_url in [url for url, used_at in response_batchers_used_at.items() if now - used_at > WORKER_RESPONSE_BATCHER_IDLE_TIMEOUT and url != queue_url]:
+            idle_batcher = response_batchers.pop(idle_url)
+            del response_batchers_used_at[idle_url]
+            idle_batcher.close()
+            closed_response_batcher_counts['entries_sent'] += idle_batcher.entries_sent
+            closed_response_batcher_counts['api_calls'] += idle_batcher.api_calls
+        batcher = response_batchers.get(queue_url)
+        if batcher is None:
+            batcher = SqsBatcher(sqs, queue_url, 'send', max_delay=WORKER_SQS_BATCH_MAX_DELAY)
+            response_batchers[queue_url] = batcher
+        response_batchers_used_at[queue_url] = now
+        return batcher
+
+def is_missing_queue_error(error):
+    """Tells whether an SQS error (SqsBatchEntryError or botocore ClientError) means the queue doesn't exist."""
+    code = getattr(error, 'code', None)
+    if code is None:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in MISSING_QUEUE_ERROR_CODES
+
+def send_response_to_sqs(original_filename, prediction_result, unique_request_id, reply_to=None):
+    """
+    Queues the prediction result for the response queue of the web node that sent the request
+    (reply_to), or the shared response SQS queue for requests without a reply address.
+    Responses are sent with send_message_batch; returns a Future resolved once SQS accepted the message.
+    """
+    message_body = f"{original_filename},{prediction_result},{unique_request_id}"
+    entry = {'MessageBody': message_body}
+    if instance_id:
+        entry['MessageAttributes'] = {'InstanceId': {'DataType': 'String', 'StringValue': instance_id}}
+    return get_response_batcher(reply_to or response_queue_url).submit(entry)
+
+def delete_request_message(receipt_handle):
+    """
+    Queues a request message for deletion from the request SQS queue.
+    Deletes are sent with delete_message_batch; returns a Future resolved once SQS deleted the message.
+    """
+    return delete_batcher.submit({'ReceiptHandle': receipt_handle})
+
+
+def get_classifier(inference_threads=None):
+    """
+    Returns the process-wide classifier, loading the model on first use.
+    inference_threads: intra-op threads for the inference backend (None = backend default).
+    """
+    global classifier
+    if classifier is None:
+        logging.info("Loading image classification model...")
+        sample_images = list_images(CLASSIFIER_SAMPLE_DIR) if CLASSIFIER_SAMPLE_DIR else []
+        classifier = ImageClassifier(sample_images=sample_images, num_threads=inference_threads)
+        logging.info(f"Image classification model loaded (backend {classifier.backend.description}).")
+        check_preprocessing_accuracy(classifier)
+    return classifier
+
+def check_preprocessing_accuracy(classifier):
+    """
+    Verifies that reduced-resolution preprocessing keeps the labels of the sample images
+    within CLASSIFIER_PREPROCESS_TOLERANCE of the reference pipeline.
+    Falls back to native-size preprocessing if it doesn't.
+    """
+    if not classifier.input_size or not CLASSIFIER_SAMPLE_DIR:
+        return
     try:
-        message_body = f"{original_filename},{prediction_result},{unique_request_id}"
-        sqs.send_message(
-            QueueUrl=response_queue_url,
-            MessageBody=message_body
-        )
-        logging.info(f"Sent response for '{original_filename}' with prediction '{prediction_result}' to response SQS (Request ID: {unique_request_id}).")
-        return True
+        sample_images = list_images(CLASSIFIER_SAMPLE_DIR)
+        agreement, within_tolerance = classifier.check_preprocessing(sample_images)
     except Exception as e:
-        logging.error(f"Failed to send response for {original_filename} to response SQS: {e}")
-        return False
-
+        logging.error(f"Preprocessing accuracy check failed: {e}. Falling back to native-size preprocessing.")
+        classifier.input_size = None
+        return
+    if within_tolerance:
+        logging.info(f"Preprocessing at input size {classifier.input_size} agrees with the reference on {agreement:.2%} of {len(sample_images)} sample image(s).")
+    else:
+        logging.warning(f"Preprocessing at input size {classifier.input_size} agrees with the reference on only {agreement:.2%} of {len(sample_images)} sample image(s) (tolerance {CLASSIFIER_PREPROCESS_TOLERANCE}). Falling back to native-size preprocessing.")
+        classifier.input_size = None
 
-def perform_image_classification(image_path):
+def perform_image_classification(image):
     """
-    Executes the external image classification script and returns its raw output.
-    The script is expected to output "image_name_with_ext,prediction_label".
+    Classifies an image with the in-process classifier engine.
+    image: a local image path or a decoded PIL image.
+    Returns the predicted label (e.g., "bathtub"), or None on failure.
     """
-    cmd = [
-        "python3",
-        os.path.join(REMOTE_APP_DIR, "image_classification.py"),
-        image_path
-    ]
-    logging.info(f"Executing classification command: {' '.join(cmd)}")
     try:
-        # Run the command and capture output
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        # The output of the script is expected to be "image_name,result" e.g., "test_0.JPEG,bathtub"
-        raw_prediction_output = result.stdout.strip()
-        logging.info(f"Classification script raw output for {image_path}: {raw_prediction_output}")
-        return raw_prediction_output
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Image classification script failed for {image_path}. Stderr: {e.stderr}")
+        prediction_label = get_classifier().classify(image)
+        logging.info(f"Classification result: {prediction_label}")
+        return prediction_label
+    except Exception as e:
+        logging.error(f"Error classifying image: {e}")
         return None
+
+def perform_batch_classification(images):
+    """
+    Classifies several images (local paths or decoded PIL images) in a single forward pass.
+    Returns a list of predicted labels in the same order as images (None for failures).
+    Falls back to per-image classification if the batch fails, so one bad image
+    doesn't fail the whole batch.
+    """
+    try:
+        prediction_labels = get_classifier().classify_batch(images)
+        logging.info(f"Classified batch of {len(images)} image(s): {prediction_labels}")
+        return prediction_labels
     except Exception as e:
-        logging.error(f"Error executing image classification script for {image_path}: {e}")
+        logging.error(f"Batch classification failed for {len(images)} image(s): {e}. Retrying one by one.")
+        return [perform_image_classification(image) for image in images]
+
+def parse_request_message(message):
+    """
+    Parses a request SQS message (see message_protocol.py for the body formats).
+    Returns a dict describing the request, or None if the message body is malformed.
+    Requests whose image travelled inline in the message carry it in 'image_bytes'.
+    """
+    request = decode_request(message['Body'])
+    if request is None:
         return None
 
-def main():
-    """Main loop for the App Tier Worker."""
-    global request_queue_url, response_queue_url
+    request['receipt_handle'] = message['ReceiptHandle']
+    # The S3 output key should be the original filename without extension (e.g., test_0)
+    request['output_s3_key_base'] = os.path.splitext(request['original_filename'])[0]
+    return request
+
+def get_visibility_timeout(queue_url):
+    """Returns the visibility timeout (seconds) of an SQS queue, or the SQS default of 30s if unavailable."""
+    try:
+        response = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['VisibilityTimeout'])
+        return int(response['Attributes'].get('VisibilityTimeout', 30))
+    except Exception as e:
+        logging.error(f"Failed to get visibility timeout of {queue_url}: {e}. Assuming 30 seconds.")
+        return 30
+
+def finish_request(request, prediction_label, on_done):
+    """
+    Uploads the result to S3, sends it to the response queue and then deletes the request message.
+    The SQS calls are batched, so this returns right after the S3 upload; on_done(success) is
+    called (from a batcher thread) once the request is fully processed or has failed.
+    """
+    # Format the content for S3 output bucket: "(image_name_base, prediction_label)"
+    # Example: "(test_0, bathtub)"
+    s3_output_content = f"({request['output_s3_key_base']}, {prediction_label})"
+
+    if not upload_result_to_s3(request['output_s3_key_base'], s3_output_content):
+        logging.error(f"Failed to upload result to S3 for {request['unique_input_s3_key']}. Message not deleted from request queue.")
+        on_done(False)
+        return
+
+    def after_delete(delete_future):
+        if delete_future.exception() is not None:
+            # The response was sent; the request may be redelivered and answered again
+            logging.error(f"Failed to delete request message for {request['unique_input_s3_key']}: {delete_future.exception()}")
+            on_done(False)
+            return
+        logging.info(f"Successfully processed {request['unique_input_s3_key']} and deleted message from request queue.")
+        on_done(True)
+
+    def after_response(response_future):
+        if response_future.exception() is not None and is_missing_queue_error(response_future.exception()):
+            # The web node waiting for this result is gone; nobody can use the result, so don't redo the work
+            logging.warning(f"Response queue for request {request['unique_request_id']} no longer exists. Deleting the request.")
+            delete_request_message(request['receipt_handle']).add_done_callback(after_delete)
+            return
+        if response_future.exception() is not None:
+            logging.error(f"Failed to send response to response SQS for {request['unique_input_s3_key']}: {response_future.exception()}. Message not deleted from request queue.")
+            on_done(False)
+            return
+        logging.info(f"Sent response for '{request['original_filename']}' with prediction '{prediction_label}' to response SQS (Request ID: {request['unique_request_id']}).")
+        # Delete message from queue only after successful processing and upload to S3 and response SQS
+        delete_request_message(request['receipt_handle']).add_done_callback(after_delete)
+
+    send_response_to_sqs(request['original_filename'], prediction_label, request['unique_request_id'], request.get('reply_to')).add_done_callback(after_response) # Send to response SQS
+
+def request_expired(request):
+    """Tells whether a request is past its deadline, i.e. the web tier no longer waits for its result."""
+    return request.get('deadline') is not None and request['deadline'] <= time.time()
+
+def request_abandoned(request):
+    """
+    Tells why the web tier no longer waits for a request's result:
+    'expired' (past its deadline), 'cancelled' (its client went away) or None if it's still wanted.
+    """
+    if request_expired(request):
+        return 'expired'
+    if cancellation_watcher.is_cancelled(request['unique_request_id'], request.get('node')):
+        return 'cancelled'
+    return None
+
+def release_image(request):
+    """Drops a request's decoded image and deletes its local copy, if any."""
+    request.pop('image', None)
+    local_image_path = request.get('local_image_path')
+    if local_image_path and os.path.exists(local_image_path):
+        os.remove(local_image_path)
+        logging.info(f"Cleaned up local file: {local_image_path}")
+
+
+class InFlightLimiter:
+    """
+    Limits how many request messages a worker holds at once.
+    The limit adapts to the measured inference rate so that everything received can be
+    finished well within the request queue's visibility timeout:
+        limit = inference_rate * visibility_timeout * WORKER_VISIBILITY_SAFETY_FACTOR
+    clamped to [WORKER_MAX_BATCH_SIZE, WORKER_MAX_IN_FLIGHT]. Until a rate has been
+    measured, only one batch worth of messages is allowed in flight.
+    """
+
+    def __init__(self, visibility_timeout):
+        self.visibility_timeout = visibility_timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.inference_rate = None # Images per second, exponentially weighted moving average
+
+    def limit(self):
+        """Returns the current in-flight limit."""
+        min_limit = max(1, WORKER_MAX_BATCH_SIZE)
+        if self.inference_rate is None:
+            return min(min_limit, WORKER_MAX_IN_FLIGHT)
+        limit = int(self.inference_rate * self.visibility_timeout * WORKER_VISIBILITY_SAFETY_FACTOR)
+        return max(min(min_limit, WORKER_MAX_IN_FLIGHT), min(limit, WORKER_MAX_IN_FLIGHT))
+
+    def acquire(self, wanted):
+        """Blocks until there is free capacity, then reserves and returns up to `wanted` slots."""
+        with self.condition:
+            while self.in_flight >= self.limit():
+                self.condition.wait()
+            granted = min(wanted, self.limit() - self.in_flight)
+            self.in_flight += granted
+            return granted
+
+    def release(self, count=1):
+        """Frees slots of finished (or abandoned) messages."""
+        with self.condition:
+            self.in_flight = max(0, self.in_flight - count)
+            self.condition.notify_all()
+
+    def record_inference(self, image_count, duration):
+        """Updates the inference rate estimate from one batch."""
+        if duration <= 0:
+            return
+        rate = image_count / duration
+        with self.condition:
+            if self.inference_rate is None:
+                self.inference_rate = rate
+            else:
+                self.inference_rate = 0.8 * self.inference_rate + 0.2 * rate
+            self.condition.notify_all()
+
+
+class VisibilityExtender:
+    """
+    Keeps in-flight request messages invisible while they are being processed.
+    A background thread extends the visibility timeout (change_message_visibility_batch) of every
+    tracked message whose timeout is about to expire, so slow batches aren't redelivered to another
+    worker and classified twice. Messages are extended for at most WORKER_MAX_VISIBILITY_EXTENSION
+    seconds in total, so a stuck message eventually becomes visible again.
+    """
+
+    def __init__(self, visibility_timeout):
+        self.visibility_timeout = visibility_timeout
+        self.lock = threading.Lock()
+        self.tracked = {} # receipt_handle -> {'received_at', 'visible_until', 'extended'}
+        # Counters
+        self.extensions = 0
+        self.extension_failures = 0
+        self.duplicates_avoided = 0 # Messages finished after their original timeout, which would otherwise have been redelivered
+
+    def start(self):
+        """Starts the heartbeat thread."""
+        threading.Thread(target=self.heartbeat_loop, name="visibility-heartbeat", daemon=True).start()
+
+    def track(self, receipt_handle):
+        """Starts keeping a received message invisible."""
+        now = time.time()
+        with self.lock:
+            self.tracked[receipt_handle] = {'received_at': now, 'visible_until': now + self.visibility_timeout, 'extended': False}
+
+    def untrack(self, receipt_handle, completed):
+        """Stops extending a message; `completed` tells whether it was fully processed and deleted."""
+        with self.lock:
+            record = self.tracked.pop(receipt_handle, None)
+            if record and completed and record['extended'] and time.time() > record['received_at'] + self.visibility_timeout:
+                self.duplicates_avoided += 1
+
+    def extend_due_messages(self):
+        """Extends every tracked message that will become visible within half a timeout."""
+        now = time.time()
+        with self.lock:
+            due = [
+                receipt_handle for receipt_handle, record in self.tracked.items()
+                if record['visible_until'] - now < self.visibility_timeout / 2
+                and now - record['received_at'] < WORKER_MAX_VISIBILITY_EXTENSION
+            ]
+        for receipt_handle in due:
+            future = visibility_batcher.submit({'ReceiptHandle': receipt_handle, 'VisibilityTimeout': self.visibility_timeout})
+            future.add_done_callback(lambda f, receipt_handle=receipt_handle, requested_at=now: self.after_extension(receipt_handle, requested_at, f))
+
+    def after_extension(self, receipt_handle, requested_at, future):
+        """Records the outcome of a visibility extension."""
+        with self.lock:
+            if future.exception() is not None:
+                self.extension_failures += 1
+                logging.warning(f"Failed to extend visibility of an in-flight message: {future.exception()}")
+                return
+            self.extensions += 1
+            record = self.tracked.get(receipt_handle)
+            if record:
+                record['visible_until'] = requested_at + self.visibility_timeout
+                record['extended'] = True
+
+    def heartbeat_loop(self):
+        """Checks the tracked messages several times per visibility timeout."""
+        interval = max(1, self.visibility_timeout / 6)
+        while True:
+            time.sleep(interval)
+            try:
+                self.extend_due_messages()
+            except Exception as e:
+                logging.error(f"Error extending message visibility: {e}")
+
+
+class WorkerPipeline:
+    """
+    Runs the worker as concurrent stages connected by bounded queues:
+        receiver -> downloaders -> inference (calling thread) -> uploaders
+    Images for the next batch are prefetched from S3 while the current batch is
+    inferring, and results are uploaded to S3/SQS in the background.
+    """
+
+    def __init__(self, temp_dir, visibility_timeout):
+        self.temp_dir = temp_dir
+        self.limiter = InFlightLimiter(visibility_timeout)
+        self.extender = VisibilityExtender(visibility_timeout)
+        self.download_queue = queue.Queue(maxsize=WORKER_MAX_IN_FLIGHT)
+        self.infer_queue = queue.Queue(maxsize=2 * max(1, WORKER_MAX_BATCH_SIZE))
+        self.upload_queue = queue.Queue(maxsize=WORKER_MAX_IN_FLIGHT)
+        self.expired_dropped = 0 # Requests deleted unprocessed because they were past their deadline
+        self.cancelled_dropped = 0 # Requests deleted unprocessed because the web tier cancelled them
+
+    def start(self):
+        """Starts the receiver, downloader, uploader and visibility heartbeat threads."""
+        self.extender.start()
+        threading.Thread(target=self.receive_loop, name="receiver", daemon=True).start()
+        for i in range(WORKER_DOWNLOAD_THREADS):
+            threading.Thread(target=self.download_loop, name=f"downloader-{i}", daemon=True).start()
+        for i in range(WORKER_UPLOAD_THREADS):
+            threading.Thread(target=self.upload_loop, name=f"uploader-{i}", daemon=True).start()
+
+    def receive_loop(self):
+        """Receives request messages as long as the in-flight limit allows."""
+        while True:
+            granted = self.limiter.acquire(10) # SQS returns at most 10 messages per receive
+            try:
+                response = sqs.receive_message(
+                    QueueUrl=request_queue_url, # Polling the request queue
+                    MaxNumberOfMessages=granted,
+                    WaitTimeSeconds=20 # Long polling
+                )
+                messages = response.get('Messages', [])
+            except Exception as e:
+                logging.error(f"Error receiving from request queue: {e}")
+                messages = []
+                time.sleep(10) # Wait before retrying in case of transient errors
+
+            # Give back the slots that weren't used
+            self.limiter.release(granted - len(messages))
+            if not messages:
+                # The long poll already waited; poll again right away so the next message isn't delayed
+                logging.info("No messages in request queue. Polling again...")
+                continue
+
+            for message in messages:
+                request = parse_request_message(message)
+                if request is None:
+                    logging.error(f"Malformed SQS message body: {message['Body']}. Skipping.")
+                    delete_request_message(message['ReceiptHandle'])
+                    self.limiter.release()
+                    continue
+                logging.info(f"Received message: Input S3 Key='{request['unique_input_s3_key']}', Original Filename='{request['original_filename']}', Request ID='{request['unique_request_id']}', ReceiptHandle='{request['receipt_handle']}'")
+                self.extender.track(request['receipt_handle'])
+                cancellation_watcher.watch(request.get('node'))
+                reason = request_abandoned(request)
+                if reason:
+                    self.drop_abandoned(request, reason)
+                    continue
+                self.download_queue.put(request)
+
+    def drop_abandoned(self, request, reason):
+        """Deletes the message of a request the web tier no longer waits for (see request_abandoned) without classifying it."""
+        if reason == 'cancelled':
+            self.cancelled_dropped += 1
+        else:
+            self.expired_dropped += 1
+        logging.warning(f"Request {request['unique_request_id']} ({request['original_filename']}) is {reason}. Deleting it unprocessed.")
+        release_image(request)
+
+        def after_delete(delete_future):
+            if delete_future.exception() is not None:
+                logging.error(f"Failed to delete {reason} request message for {request['unique_input_s3_key']}: {delete_future.exception()}")
+            self.finish_message(request, delete_future.exception() is None)
+
+        delete_request_message(request['receipt_handle']).add_done_callback(after_delete)
+
+    def finish_message(self, request, completed):
+        """Stops tracking a request message and frees its in-flight slot."""
+        self.extender.untrack(request['receipt_handle'], completed)
+        self.limiter.release()
+
+    def fetch_image(self, request):
+        """
+        Fetches a request's image and stores it on the request.
+        Images sent inline in the request message are used as they are; others come from S3.
+        With WORKER_IN_MEMORY_IMAGES the image is decoded straight from memory into
+        request['image'] (no temp file); otherwise it is written to request['local_image_path'].
+        Returns True on success.
+        """
+        inline_bytes = request.pop('image_bytes', None)
+        if WORKER_IN_MEMORY_IMAGES:
+            image_bytes = inline_bytes if inline_bytes is not None else download_image_bytes_from_s3(request['unique_input_s3_key'])
+            if image_bytes is None:
+                return False
+            try:
+                # Decode here, on the downloader thread, so the compressed bytes can be freed right away
+                request['image'] = get_classifier().decode(image_bytes)
+                return True
+            except Exception as e:
+                logging.error(f"Error decoding image {request['unique_input_s3_key']}: {e}")
+                return False
+
+        # Name the local file after the unique input key so in-flight requests for the same filename don't collide
+        request['local_image_path'] = os.path.join(self.temp_dir, request['unique_input_s3_key'])
+        if inline_bytes is not None:
+            try:
+                with open(request['local_image_path'], 'wb') as f:
+                    f.write(inline_bytes)
+                return True
+            except Exception as e:
+                logging.error(f"Error writing inline image {request['unique_input_s3_key']} to {request['local_image_path']}: {e}")
+                return False
+        return download_image_from_s3(request['unique_input_s3_key'], request['local_image_path'])
+
+    def download_loop(self):
+        """Prefetches images (from S3, or from the request message when sent inline) for the inference stage."""
+        while True:
+            request = self.download_queue.get()
+            reason = request_abandoned(request)
+            if reason:
+                self.drop_abandoned(request, reason)
+                continue
+            if self.fetch_image(request):
+                self.infer_queue.put(request)
+            else:
+                logging.error(f"Failed to download image {request['unique_input_s3_key']}. Message not deleted from request queue.")
+                release_image(request)
+                self.finish_message(request, False)
+
+    def upload_loop(self):
+        """Publishes results to S3 and the response queue and deletes finished request messages."""
+        while True:
+            request, prediction_label = self.upload_queue.get()
+            try:
+                # The in-flight slot is freed once the batched response and delete are acknowledged
+                finish_request(request, prediction_label, lambda success, request=request: self.finish_message(request, success))
+            except Exception as e:
+                logging.error(f"Error finishing request {request['unique_request_id']}: {e}")
+                self.finish_message(request, False)
+
+    def next_batch(self, timeout):
+        """
+        Collects up to WORKER_MAX_BATCH_SIZE downloaded requests.
+        Waits up to `timeout` for the first one, then at most WORKER_MAX_BATCH_WAIT seconds to fill the batch.
+        """
+        try:
+            batch = [self.infer_queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + WORKER_MAX_BATCH_WAIT
+        while len(batch) < max(1, WORKER_MAX_BATCH_SIZE):
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self.infer_queue.get(timeout=remaining))
+                else:
+                    batch.append(self.infer_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def log_stats(self):
+        """Logs the worker's SQS batching and visibility heartbeat counters."""
+        logging.info(
+            f"Worker stats: in flight {self.limiter.in_flight}/{self.limiter.limit()}, "
+            f"visibility extensions {self.extender.extensions} (failed {self.extender.extension_failures}), "
+            f"duplicates avoided {self.extender.duplicates_avoided}, "
+            f"expired requests dropped {self.expired_dropped}, cancelled requests dropped {self.cancelled_dropped}, "
+            f"responses sent {closed_response_batcher_counts['entries_sent'] + sum(batcher.entries_sent for batcher in list(response_batchers.values()))} "
+            f"in {closed_response_batcher_counts['api_calls'] + sum(batcher.api_calls for batcher in list(response_batchers.values()))} call(s) to {len(response_batchers)} active queue(s), "
+            f"deletes {delete_batcher.entries_sent} in {delete_batcher.api_calls} call(s)"
+        )
+
+    def infer_batch(self, batch):
+        """Classifies a batch and hands the results to the uploaders."""
+        # Don't spend inference time on requests that expired or were cancelled while they were queued
+        live_batch = []
+        for request in batch:
+            reason = request_abandoned(request)
+            if reason:
+                self.drop_abandoned(request, reason)
+            else:
+                live_batch.append(request)
+        if not live_batch:
+            return
+        batch = live_batch
+        start_time = time.time()
+        try:
+            prediction_labels = perform_batch_classification([request['image'] if 'image' in request else request['local_image_path'] for request in batch])
+        finally:
+            for request in batch:
+                release_image(request)
+        self.limiter.record_inference(len(batch), time.time() - start_time)
+
+        for request, prediction_label in zip(batch, prediction_labels):
+            if prediction_label:
+                self.upload_queue.put((request, prediction_label))
+            else:
+                logging.error(f"Image classification failed for {request['unique_input_s3_key']}. Message not deleted from request queue.")
+                self.finish_message(request, False)
+
+
+def main(heartbeat=None, inference_threads=None):
+    """
+    Main loop for the App Tier Worker.
+    heartbeat: optional callable invoked once per loop iteration with the number of
+    messages handled, used by app_tier_supervisor.py to monitor worker health.
+    inference_threads: intra-op threads for the inference backend (None = backend default).
+    """
+    global request_queue_url, response_queue_url, delete_batcher, visibility_batcher, instance_id
     
     # Initialize queue URLs once
     request_queue_url = get_queue_url(SQS_QUEUE_NAME)
@@ -134,86 +706,45 @@ def main():
         logging.error("Could not get response SQS queue URL. Exiting worker.")
         return
 
-    # Create a temporary directory for image downloads
+    # Completed results are acknowledged in batches of up to 10 (delete_message_batch here;
+    # send_message_batch per response queue, see get_response_batcher)
+    delete_batcher = SqsBatcher(sqs, request_queue_url, 'delete', max_delay=WORKER_SQS_BATCH_MAX_DELAY)
+    visibility_batcher = SqsBatcher(sqs, request_queue_url, 'change_visibility', max_delay=WORKER_SQS_BATCH_MAX_DELAY)
+    cancellation_watcher.start()
+    instance_id = get_instance_id()
+
+    # Load the model up front so the first request doesn't pay for it
+    get_classifier(inference_threads)
+    if instance_id and os.environ.get(APP_READY_MARKER_ENV):
+        mark_instance_ready()
+
+    # Create a temporary directory for image downloads (only used when images aren't kept in memory)
     # Use /tmp for temporary files as it's typically cleared on reboot.
     temp_dir = "/tmp/image_processing"
-    os.makedirs(temp_dir, exist_ok=True)
-    logging.info(f"Created temporary directory: {temp_dir}")
+    if not WORKER_IN_MEMORY_IMAGES:
+        os.makedirs(temp_dir, exist_ok=True)
+        logging.info(f"Created temporary directory: {temp_dir}")
 
-    logging.info("App Tier Worker started. Polling SQS for messages...")
+    visibility_timeout = get_visibility_timeout(request_queue_url)
+    pipeline = WorkerPipeline(temp_dir, visibility_timeout)
+    pipeline.start()
+
+    logging.info(f"App Tier Worker started (max batch size {WORKER_MAX_BATCH_SIZE}, max batch wait {WORKER_MAX_BATCH_WAIT}s, visibility timeout {visibility_timeout}s). Polling SQS for messages...")
+    last_stats_time = time.time()
     while True:
         try:
-            response = sqs.receive_message(
-                QueueUrl=request_queue_url, # Polling the request queue
-                MaxNumberOfMessages=1,
-                WaitTimeSeconds=20 # Long polling
-            )
-
-            messages = response.get('Messages', [])
-            if not messages:
-                logging.info("No messages in request queue. Waiting...")
-                time.sleep(5) # Short sleep if no messages found quickly
+            if heartbeat:
+                heartbeat(0)
+            if time.time() - last_stats_time >= WORKER_STATS_INTERVAL:
+                pipeline.log_stats()
+                last_stats_time = time.time()
+            batch = pipeline.next_batch(timeout=5)
+            if not batch:
                 continue
 
-            for message in messages:
-                receipt_handle = message['ReceiptHandle']
-                # Message body contains "unique_input_s3_key,original_filename,unique_request_id"
-                # Example: "uuid-test_0.JPEG,test_0.JPEG,test_0-uuid"
-                message_parts = message['Body'].split(',', 2) # Split at most twice
-                if len(message_parts) != 3:
-                    logging.error(f"Malformed SQS message body: {message['Body']}. Skipping.")
-                    sqs.delete_message(QueueUrl=request_queue_url, ReceiptHandle=receipt_handle)
-                    continue
-
-                unique_input_s3_key = message_parts[0]
-                original_filename = message_parts[1] 
-                unique_request_id = message_parts[2]
-
-                # The S3 output key should be the original filename without extension (e.g., test_0)
-                output_s3_key_base = os.path.splitext(original_filename)[0]
-
-                logging.info(f"Received message: Input S3 Key='{unique_input_s3_key}', Original Filename='{original_filename}', Request ID='{unique_request_id}', ReceiptHandle='{receipt_handle}'")
-
-                local_image_path = os.path.join(temp_dir, original_filename)
-
-                if download_image_from_s3(unique_input_s3_key, local_image_path):
-                    raw_prediction_output = perform_image_classification(local_image_path) # e.g., "test_0.JPEG,bathtub"
-
-                    if raw_prediction_output:
-                        # Parse the raw output from image_classification.py
-                        # It's expected to be "image_name_with_ext,prediction_label"
-                        output_parts = raw_prediction_output.split(',', 1)
-                        if len(output_parts) == 2:
-                            # image_name_from_classifier = output_parts[0] # e.g., test_0.JPEG
-                            prediction_label = output_parts[1] # e.g., bathtub
-
-                            # Format the content for S3 output bucket: "(image_name_base, prediction_label)"
-                            # Example: "(test_0, bathtub)"
-                            s3_output_content = f"({output_s3_key_base}, {prediction_label})"
-                            
-                            s3_uploaded = upload_result_to_s3(output_s3_key_base, s3_output_content)
-                            sqs_response_sent = send_response_to_sqs(original_filename, prediction_label, unique_request_id) # Send to response SQS
-
-                            if s3_uploaded and sqs_response_sent:
-                                # Delete message from queue only after successful processing and upload to S3 and response SQS
-                                sqs.delete_message(
-                                    QueueUrl=request_queue_url,
-                                    ReceiptHandle=receipt_handle
-                                )
-                                logging.info(f"Successfully processed {unique_input_s3_key} and deleted message from request queue.")
-                            else:
-                                logging.error(f"Failed to upload result to S3 or send to response SQS for {unique_input_s3_key}. Message not deleted from request queue.")
-                        else:
-                            logging.error(f"Unexpected format from classification script: {raw_prediction_output}. Message not deleted from request queue.")
-                    else:
-                        logging.error(f"Image classification failed for {unique_input_s3_key}. Message not deleted from request queue.")
-                else:
-                    logging.error(f"Failed to download image {unique_input_s3_key}. Message not deleted from request queue.")
-
-                # Clean up local image file
-                if os.path.exists(local_image_path):
-                    os.remove(local_image_path)
-                    logging.info(f"Cleaned up local file: {local_image_path}")
+            pipeline.infer_batch(batch)
+            if heartbeat:
+                heartbeat(len(batch))
 
         except Exception as e:
             logging.error(f"An error occurred in the worker loop: {e}")
@@ -221,4 +752,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,421 @@
+# autoscaling.py
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from config import (
+    MAX_APP_INSTANCES, MIN_APP_INSTANCES, SCALING_CHECK_INTERVAL,
+    MIN_INSTANCES_AT_MAX_QUEUE, MESSAGES_PER_INSTANCE, MAX_QUEUE_DEPTH_THRESHOLD,
+    SCALE_OUT_COOLDOWN, SCALE_IN_COOLDOWN, SCALING_HYSTERESIS, SCALE_OUT_MAX_STEP, SCALE_IN_MAX_STEP,
+    THRESHOLD_POLICY_QUEUE_DEPTH,
+    PREDICTIVE_LEVEL_SMOOTHING, PREDICTIVE_TREND_SMOOTHING, PREDICTIVE_INSTANCE_SERVICE_RATE,
+    PREDICTIVE_DEFAULT_BOOT_LATENCY, PREDICTIVE_HEADROOM,
+    SLO_P95_LATENCY, SLO_DEFAULT_BASE_LATENCY
+)
+
+# Registry of auto-scaling policies by name (filled by @register_policy)
+SCALING_POLICIES = {}
+
+
+def register_policy(name):
+    """Class decorator registering a ScalingPolicy subclass under `name`."""
+    def decorator(cls):
+        cls.name = name
+        SCALING_POLICIES[name] = cls
+        return cls
+    return decorator
+
+def create_policy(name, **kwargs):
+    """Instantiates the auto-scaling policy registered under `name`."""
+    if name not in SCALING_POLICIES:
+        raise ValueError(f"Unknown auto-scaling policy '{name}'. Available policies: {sorted(SCALING_POLICIES)}.")
+    return SCALING_POLICIES[name](**kwargs)
+
+
+def measure_instance_service_rate(estimate, metrics, saturation_depth):
+    """
+    Updates an estimate of the requests per second one app instance serves.
+    The response rate only measures capacity while every ready instance is busy, i.e.,
+    while the queue holds at least saturation_depth messages per ready instance.
+    """
+    ready = metrics['ready_instances']
+    if ready > 0 and metrics['queue_depth'] >= ready * saturation_depth and metrics['service_rate'] > 0:
+        return 0.7 * estimate + 0.3 * metrics['service_rate'] / ready
+    return estimate
+
+def erlang_c(servers, offered_load):
+    """Returns the probability that a request has to queue in an M/M/c system (offered load = arrival rate / service rate < servers)."""
+    # Erlang B by its recurrence (numerically stable), then converted to Erlang C
+    erlang_b = 1.0
+    for k in range(1, servers + 1):
+        erlang_b = offered_load * erlang_b / (k + offered_load * erlang_b)
+    return servers * erlang_b / (servers - offered_load * (1 - erlang_b))
+
+def queueing_delay_quantile(servers, arrival_rate, service_rate, quantile):
+    """
+    Returns the `quantile` (e.g., 0.95) of the time a request waits for a free server in an M/M/c system,
+    from P(wait > t) = C(c, a) * exp(-(c * service_rate - arrival_rate) * t); infinite if the system is overloaded.
+    """
+    if arrival_rate <= 0:
+        return 0.0
+    offered_load = arrival_rate / service_rate
+    if servers <= offered_load:
+        return math.inf
+    wait_probability = erlang_c(servers, offered_load)
+    if wait_probability <= 1 - quantile:
+        return 0.0
+    return math.log(wait_probability / (1 - quantile)) / (servers * service_rate - arrival_rate)
+
+
+class RateTracker:
+    """Counts events (e.g., request arrivals) in one-second buckets and reports their rate over a recent window."""
+
+    def __init__(self, max_window=600):
+        self.max_window = max_window
+        self.lock = threading.Lock()
+        self.buckets = deque() # [second, count], oldest first
+
+    def record(self, count=1, now=None):
+        """Counts `count` events at `now` (default: the current time)."""
+        second = int(now if now is not None else time.time())
+        with self.lock:
+            if self.buckets and self.buckets[-1][0] == second:
+                self.buckets[-1][1] += count
+            else:
+                self.buckets.append([second, count])
+            while self.buckets and self.buckets[0][0] < second - self.max_window:
+                self.buckets.popleft()
+
+    def rate(self, window, now=None):
+        """Returns the average number of events per second over the last `window` seconds."""
+        cutoff = (now if now is not None else time.time()) - window
+        with self.lock:
+            count = sum(bucket_count for second, bucket_count in self.buckets if second >= cutoff)
+        return count / max(window, 1.0)
+
+
+class HoltForecaster:
+    """
+    Holt's linear (double exponential) smoothing of an irregularly sampled series, such as the request arrival rate.
+    `level_smoothing` and `trend_smoothing` weigh new samples against the current level and trend (per second).
+    """
+
+    def __init__(self, level_smoothing=PREDICTIVE_LEVEL_SMOOTHING, trend_smoothing=PREDICTIVE_TREND_SMOOTHING):
+        self.level_smoothing = level_smoothing
+        self.trend_smoothing = trend_smoothing
+        self.level = None
+        self.trend = 0.0
+        self.updated_at = None
+
+    def update(self, value, now):
+        """Adds a sample observed at `now`."""
+        if self.level is None:
+            self.level, self.updated_at = value, now
+            return
+        elapsed = max(now - self.updated_at, 1e-3)
+        previous_level = self.level
+        self.level = self.level_smoothing * value + (1 - self.level_smoothing) * (previous_level + self.trend * elapsed)
+        self.trend = self.trend_smoothing * (self.level - previous_level) / elapsed + (1 - self.trend_smoothing) * self.trend
+        self.updated_at = now
+
+    def forecast(self, horizon):
+        """Returns the expected value `horizon` seconds after the last sample (never negative)."""
+        if self.level is None:
+            return 0.0
+        return max(0.0, self.level + self.trend * horizon)
+
+
+class BootLatencyEstimator:
+    """
+    Measures how long new app instances take from launch to their first response
+    (booting, installing dependencies, loading the model) and keeps an exponentially weighted average.
+    launched() and responded() may be called from different threads.
+    """
+
+    def __init__(self, default=PREDICTIVE_DEFAULT_BOOT_LATENCY, smoothing=0.3):
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.launch_times = {} # instance_id -> launched_at, for instances that haven't responded yet
+        self.latency = default
+        self.samples = 0
+
+    def launched(self, instance_id, now=None):
+        """Records that an instance was launched."""
+        with self.lock:
+            self.launch_times[instance_id] = now if now is not None else time.time()
+
+    def responded(self, instance_id, now=None):
+        """Records a response from an instance; the first one after its launch is a boot latency sample."""
+        if instance_id is None:
+            return
+        now = now if now is not None else time.time()
+        with self.lock:
+            launched_at = self.launch_times.get(instance_id)
+            # A response older than the launch came from before the instance was last stopped (warm pool)
+            if launched_at is None or now < launched_at:
+                return
+            del self.launch_times[instance_id]
+            latency = now - launched_at
+            self.latency = latency if self.samples == 0 else self.smoothing * latency + (1 - self.smoothing) * self.latency
+            self.samples += 1
+        logging.info(f"Instance {instance_id} ready {latency:.0f}s after launch (average boot latency {self.latency:.0f}s).")
+
+    def retain(self, instance_ids):
+        """Forgets launched instances that are no longer running."""
+        with self.lock:
+            for instance_id in [instance_id for instance_id in self.launch_times if instance_id not in instance_ids]:
+                del self.launch_times[instance_id]
+
+    def booting(self):
+        """Returns the number of launched instances that haven't responded yet."""
+        return len(self.launch_times)
+
+    def is_booting(self, instance_id):
+        """Tells whether an instance was launched and hasn't responded yet."""
+        with self.lock:
+            return instance_id in self.launch_times
+
+
+class ScalingPolicy:
+    """
+    Interface of an auto-scaling policy.
+    The controller calls decide() every SCALING_CHECK_INTERVAL seconds with a dict of metrics:
+    - queue_depth: messages in the request queue (waiting + being processed)
+    - instances: number of app instances currently running
+    - now: the current time (epoch seconds)
+    - arrival_rate: requests per second sent by all web processes recently
+    - service_rate: responses per second all web processes received recently
+    - ready_instances: running instances that have answered requests of any web process (the rest are still booting)
+    - boot_latency: measured time (seconds) from launching an instance to its first response
+    - latency_p95, latency_p05: observed end-to-end request latency percentiles (seconds; None without samples)
+    and launches or terminates app instances to reach the returned target.
+    Targets are clamped to [min_instances, max_instances].
+    """
+
+    name = None
+
+    def __init__(self, min_instances=MIN_APP_INSTANCES, max_instances=MAX_APP_INSTANCES):
+        self.min_instances = min_instances
+        self.max_instances = max_instances
+
+    def clamp(self, instances):
+        """Limits an instance count to the policy's bounds."""
+        return max(self.min_instances, min(self.max_instances, instances))
+
+    def decide(self, metrics):
+        """Returns the number of app instances that should be running."""
+        raise NotImplementedError
+
+    def state(self):
+        """Returns the policy's internal estimates, for monitoring."""
+        return {}
+
+
+@register_policy('threshold')
+class ThresholdPolicy(ScalingPolicy):
+    """The original all-or-nothing rule: max_instances while the queue is deeper than queue_threshold, otherwise min_instances."""
+
+    def __init__(self, min_instances=MIN_APP_INSTANCES, max_instances=MAX_APP_INSTANCES, queue_threshold=THRESHOLD_POLICY_QUEUE_DEPTH):
+        super().__init__(min_instances, max_instances)
+        self.queue_threshold = queue_threshold
+
+    def decide(self, metrics):
+        return self.max_instances if metrics['queue_depth'] > self.queue_threshold else self.min_instances
+
+
+@register_policy('proportional')
+class ProportionalPolicy(ScalingPolicy):
+    """
+    Sizes the app tier to the queue: one instance per messages_per_instance queued messages,
+    and at least instances_at_max_depth once the queue reaches max_depth_threshold.
+    To avoid thrashing:
+    - scale-in only happens once the queue would keep fewer instances busy even at
+      (1 - hysteresis) * messages_per_instance messages each (a band below the scale-out point);
+    - scale-out steps are at least scale_out_cooldown seconds apart, and scale-in waits
+      scale_in_cooldown seconds after any scaling step;
+    - one step adds at most scale_out_max_step and removes at most scale_in_max_step instances.
+    """
+
+    def __init__(self, min_instances=MIN_APP_INSTANCES, max_instances=MAX_APP_INSTANCES,
+                 messages_per_instance=MESSAGES_PER_INSTANCE, max_depth_threshold=MAX_QUEUE_DEPTH_THRESHOLD,
+                 instances_at_max_depth=MIN_INSTANCES_AT_MAX_QUEUE, hysteresis=SCALING_HYSTERESIS,
+                 scale_out_cooldown=SCALE_OUT_COOLDOWN, scale_in_cooldown=SCALE_IN_COOLDOWN,
+                 scale_out_max_step=SCALE_OUT_MAX_STEP, scale_in_max_step=SCALE_IN_MAX_STEP):
+        super().__init__(min_instances, max_instances)
+        self.messages_per_instance = max(1, messages_per_instance)
+        self.max_depth_threshold = max_depth_threshold
+        self.instances_at_max_depth = instances_at_max_depth
+        self.hysteresis = min(max(hysteresis, 0.0), 0.9)
+        self.scale_out_cooldown = scale_out_cooldown
+        self.scale_in_cooldown = scale_in_cooldown
+        self.scale_out_max_step = max(1, scale_out_max_step)
+        self.scale_in_max_step = max(1, scale_in_max_step)
+        self.last_scale_out = float('-inf')
+        self.last_scale_in = float('-inf')
+
+    def instances_for(self, queue_depth, messages_per_instance):
+        """Returns the clamped number of instances for a queue depth at a given per-instance load."""
+        instances = math.ceil(queue_depth / messages_per_instance)
+        if queue_depth >= self.max_depth_threshold:
+            instances = max(instances, self.instances_at_max_depth)
+        return self.clamp(instances)
+
+    def scale_out_target(self, metrics):
+        """Returns the instance count to scale out to (acted on when above the current count)."""
+        return self.instances_for(metrics['queue_depth'], self.messages_per_instance)
+
+    def scale_in_target(self, metrics):
+        """Returns the instance count to scale in to (acted on when below the current count)."""
+        # Scale in only below the hysteresis band
+        return self.instances_for(metrics['queue_depth'], self.messages_per_instance * (1 - self.hysteresis))
+
+    def decide(self, metrics):
+        current, now = metrics['instances'], metrics['now']
+
+        scale_out_target = self.scale_out_target(metrics)
+        if scale_out_target > current:
+            if now - self.last_scale_out < self.scale_out_cooldown:
+                logging.info(f"{self.name.capitalize()} policy: want {scale_out_target} instance(s) but scale-out is cooling down.")
+                return current
+            self.last_scale_out = now
+            return min(scale_out_target, current + self.scale_out_max_step)
+
+        scale_in_target = self.scale_in_target(metrics)
+        if scale_in_target < current:
+            if now - max(self.last_scale_out, self.last_scale_in) < self.scale_in_cooldown:
+                return current
+            self.last_scale_in = now
+            return max(scale_in_target, current - self.scale_in_max_step)
+
+        return current
+
+
+@register_policy('predictive')
+class PredictivePolicy(ProportionalPolicy):
+    """
+    Provisions ahead of demand: forecasts the request arrival rate one boot latency ahead
+    (Holt's linear trend) and runs enough instances to serve it, with `headroom` to spare.
+    Per-instance capacity is measured from the response rate while the queue has a backlog of
+    more than messages_per_instance messages per ready instance (they are then saturated) and defaults to instance_service_rate until then.
+    Arrival and service rates are the totals of all web processes (the controller sums what each publishes
+    under WEB_STATS_PREFIX), so the forecast and the per-instance capacity describe the whole Web Tier.
+    The queue-depth targets of the proportional policy remain a floor, and its cooldowns,
+    hysteresis and step limits apply to the result.
+    """
+
+    def __init__(self, instance_service_rate=PREDICTIVE_INSTANCE_SERVICE_RATE, headroom=PREDICTIVE_HEADROOM,
+                 level_smoothing=PREDICTIVE_LEVEL_SMOOTHING, trend_smoothing=PREDICTIVE_TREND_SMOOTHING, **kwargs):
+        super().__init__(**kwargs)
+        self.instance_service_rate = instance_service_rate
+        self.headroom = headroom
+        self.forecaster = HoltForecaster(level_smoothing, trend_smoothing)
+        self.forecast_rate = 0.0
+        self.predicted_instances = 0
+
+    def update(self, metrics):
+        """Feeds the latest rates into the forecaster and the per-instance capacity estimate."""
+        self.forecaster.update(metrics['arrival_rate'], metrics['now'])
+        self.instance_service_rate = measure_instance_service_rate(self.instance_service_rate, metrics, self.messages_per_instance)
+        horizon = metrics['boot_latency'] + SCALING_CHECK_INTERVAL
+        # Current demand still has to be served if the trend points down
+        self.forecast_rate = max(self.forecaster.level, self.forecaster.forecast(horizon))
+        self.predicted_instances = self.clamp(math.ceil(self.forecast_rate * (1 + self.headroom) / max(self.instance_service_rate, 1e-3)))
+
+    def scale_out_target(self, metrics):
+        return max(super().scale_out_target(metrics), self.predicted_instances)
+
+    def scale_in_target(self, metrics):
+        return max(super().scale_in_target(metrics), self.predicted_instances)
+
+    def decide(self, metrics):
+        self.update(metrics)
+        return super().decide(metrics)
+
+    def state(self):
+        return {
+            'arrival_rate_level': self.forecaster.level,
+            'arrival_rate_trend': self.forecaster.trend,
+            'forecast_rate': self.forecast_rate,
+            'instance_service_rate': self.instance_service_rate,
+            'predicted_instances': self.predicted_instances,
+        }
+
+
+@register_policy('latency_slo')
+class LatencySloPolicy(ProportionalPolicy):
+    """
+    Runs the fewest instances that keep the p95 end-to-end latency within p95_target, ignoring queue depth targets.
+    The app tier is modelled as an M/M/c queue with one server per instance: requests arrive at the
+    (smoothed) measured arrival rate and each instance serves the measured per-instance rate (see
+    measure_instance_service_rate). A request's latency is its queueing delay plus the base latency
+    (upload, inference and delivery without queueing), estimated by the observed p5 latency.
+    The instance count must also drain the current backlog within the latency budget (Little's law).
+    While the observed p95 misses the target, at least one more instance is added per step, and
+    instances are only removed while it is below (1 - hysteresis) * p95_target;
+    the proportional policy's cooldowns and step limits apply.
+    """
+
+    def __init__(self, p95_target=SLO_P95_LATENCY, instance_service_rate=PREDICTIVE_INSTANCE_SERVICE_RATE,
+                 base_latency=SLO_DEFAULT_BASE_LATENCY, rate_smoothing=PREDICTIVE_LEVEL_SMOOTHING, **kwargs):
+        super().__init__(**kwargs)
+        self.p95_target = p95_target
+        self.instance_service_rate = instance_service_rate
+        self.base_latency = base_latency
+        self.rate_smoothing = rate_smoothing
+        self.arrival_rate = None
+        self.observed_p95 = None
+        self.required_instances = 0
+
+    def instances_for_slo(self, queue_depth):
+        """Returns the smallest instance count (within the bounds) expected to meet the p95 target, or max_instances if none is."""
+        budget = self.p95_target - self.base_latency
+        if budget <= 0:
+            logging.warning(f"Latency SLO policy: base latency {self.base_latency:.1f}s leaves no room for the {self.p95_target}s p95 target.")
+            return self.max_instances
+        if self.arrival_rate <= 0 and queue_depth <= 0:
+            return self.min_instances
+        service_rate = max(self.instance_service_rate, 1e-3)
+        for servers in range(max(1, self.min_instances), self.max_instances + 1):
+            if queue_depth / (servers * service_rate) > budget:
+                continue
+            if queueing_delay_quantile(servers, self.arrival_rate, service_rate, 0.95) <= budget:
+                return servers
+        return self.max_instances
+
+    def update(self, metrics):
+        """Feeds the latest measurements into the rate and latency estimates."""
+        rate = metrics['arrival_rate']
+        self.arrival_rate = rate if self.arrival_rate is None else self.rate_smoothing * rate + (1 - self.rate_smoothing) * self.arrival_rate
+        self.instance_service_rate = measure_instance_service_rate(self.instance_service_rate, metrics, self.messages_per_instance)
+        if metrics.get('latency_p05') is not None:
+            self.base_latency = metrics['latency_p05']
+        self.observed_p95 = metrics.get('latency_p95')
+        self.required_instances = self.instances_for_slo(metrics['queue_depth'])
+
+    def scale_out_target(self, metrics):
+        # The model is only an estimate: while the observed p95 misses the target, keep adding capacity
+        if self.observed_p95 is not None and self.observed_p95 > self.p95_target:
+            return self.clamp(max(self.required_instances, metrics['instances'] + 1))
+        return self.required_instances
+
+    def scale_in_target(self, metrics):
+        if self.observed_p95 is not None and self.observed_p95 > (1 - self.hysteresis) * self.p95_target:
+            return metrics['instances']
+        return self.required_instances
+
+    def decide(self, metrics):
+        self.update(metrics)
+        return super().decide(metrics)
+
+    def state(self):
+        return {
+            'p95_target': self.p95_target,
+            'observed_p95': self.observed_p95,
+            'base_latency': self.base_latency,
+            'arrival_rate': self.arrival_rate,
+            'instance_service_rate': self.instance_service_rate,
+            'required_instances': self.required_instances,
+        }
@@ -0,0 +1,154 @@
+# cancellation.py
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+# S3 key (in the control bucket) of the set of recently cancelled request IDs published by the web tier
+CANCELLATION_KEY = 'cancelled.json'
+# Prefix of the per-node sets, one published by every web node (process)
+CANCELLATION_PREFIX = 'cancelled/'
+
+
+def cancellation_key(node_id=None):
+    """Returns the S3 key of a web node's cancelled set (the shared key for requests without a node)."""
+    if node_id is None:
+        return CANCELLATION_KEY
+    return f"{CANCELLATION_PREFIX}{node_id}.json"
+
+
+class CancellationPublisher:
+    """
+    Web tier side of the cancellation channel: keeps the IDs of recently cancelled requests
+    (clients that disconnected or timed out) and publishes them as one small JSON object in S3.
+    IDs are kept for `ttl` seconds; after that the request's deadline makes workers drop it anyway.
+    cancel() may be called from the event loop while publish() runs on an I/O thread.
+    """
+
+    def __init__(self, s3_client, bucket, ttl, key=CANCELLATION_KEY):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.cancelled = OrderedDict() # request_id -> cancelled_at, oldest first
+        self.dirty = False
+        # Counters for monitoring
+        self.cancellations = 0
+        self.publishes = 0
+
+    def cancel(self, request_id):
+        """Adds a request to the cancelled set (published on the next publish())."""
+        with self.lock:
+            self.cancelled[request_id] = time.time()
+            self.cancelled.move_to_end(request_id)
+            self.cancellations += 1
+            self.dirty = True
+
+    def evict_expired(self):
+        """Drops IDs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            while self.cancelled and next(iter(self.cancelled.values())) < cutoff:
+                self.cancelled.popitem(last=False)
+                self.dirty = True
+
+    def publish(self):
+        """Writes the cancelled set to S3 if it changed since the last publish. Returns True on success."""
+        self.evict_expired()
+        with self.lock:
+            if not self.dirty:
+                return True
+            request_ids = list(self.cancelled)
+            self.dirty = False
+        body = json.dumps({'updated': time.time(), 'cancelled': request_ids}, separators=(',', ':'))
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode('utf-8'), ContentType='application/json')
+            self.publishes += 1
+            return True
+        except Exception as e:
+            logging.error(f"Error publishing {len(request_ids)} cancelled request(s) to s3://{self.bucket}/{self.key}: {e}")
+            with self.lock:
+                self.dirty = True # Try again on the next publish
+            return False
+
+    def delete(self):
+        """Removes the published set (when the node shuts down)."""
+        try:
+            self.s3.delete_object(Bucket=self.bucket, Key=self.key)
+        except Exception as e:
+            logging.error(f"Error deleting s3://{self.bucket}/{self.key}: {e}")
+
+
+class CancellationWatcher:
+    """
+    App tier side of the cancellation channel: a background thread polls the cancelled set
+    of every web node this worker received requests from (see watch()) every `interval` seconds.
+    Polls are conditional on each object's ETag, so an unchanged set costs a 304 response and no download.
+    Nodes that sent no request for `forget_after` seconds are no longer polled.
+    """
+
+    def __init__(self, s3_client, bucket, interval, forget_after=3600):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.interval = interval
+        self.forget_after = forget_after
+        self.lock = threading.Lock()
+        self.nodes = {} # node_id -> {'last_seen', 'etag', 'cancelled'}
+
+    def start(self):
+        """Starts the polling thread."""
+        threading.Thread(target=self.watch_loop, name="cancellation-watcher", daemon=True).start()
+
+    def watch(self, node_id=None):
+        """Makes sure the cancelled set of a web node (None: the shared set) is polled."""
+        with self.lock:
+            state = self.nodes.get(node_id)
+            if state is None:
+                self.nodes[node_id] = {'last_seen': time.time(), 'etag': None, 'cancelled': frozenset()}
+            else:
+                state['last_seen'] = time.time()
+
+    def is_cancelled(self, request_id, node_id=None):
+        """Tells whether a web node has cancelled a request."""
+        state = self.nodes.get(node_id)
+        return state is not None and request_id in state['cancelled']
+
+    def refresh(self, node_id, state):
+        """Fetches a node's cancelled set if it changed since the last fetch."""
+        key = cancellation_key(node_id)
+        kwargs = {'IfNoneMatch': state['etag']} if state['etag'] else {}
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('304', 'NotModified'):
+                return
+            if code in ('404', 'NoSuchKey'):
+                # Nothing published (yet, or any more)
+                state['etag'] = None
+                state['cancelled'] = frozenset()
+                return
+            raise
+        body = json.loads(response['Body'].read())
+        state['cancelled'] = frozenset(body.get('cancelled', []))
+        state['etag'] = response.get('ETag')
+
+    def watch_loop(self):
+        """Background thread refreshing the cancelled sets."""
+        while True:
+            with self.lock:
+                cutoff = time.time() - self.forget_after
+                for node_id in [node_id for node_id, state in self.nodes.items() if state['last_seen'] < cutoff]:
+                    del self.nodes[node_id]
+                nodes = list(self.nodes.items())
+            for node_id, state in nodes:
+                try:
+                    self.refresh(node_id, state)
+                except Exception as e:
+                    logging.error(f"Error fetching cancelled requests from s3://{self.bucket}/{cancellation_key(node_id)}: {e}")
+            time.sleep(self.interval)
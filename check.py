@@ -44,11 +44,30 @@ def show_status():
     except Exception as e:
         print("Error retrieving EC2 instances:", e)
 
+    # Show the warm pool (stopped instances are ready to start)
+    print("=== EC2 Warm Pool ===")
+    try:
+        resp = ec2.describe_instances(
+            Filters=[
+                {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+                {'Name': 'tag:Name', 'Values': ['app-pool-*']}
+            ]
+        )
+        states = {}
+        for reservation in resp['Reservations']:
+            for instance in reservation['Instances']:
+                states[instance['InstanceId']] = instance['State']['Name']
+        print(f"Warm pool size: {len(states)} ({sum(1 for state in states.values() if state == 'stopped')} ready)")
+        print("Instances:", states)
+    except Exception as e:
+        print("Error retrieving warm pool instances:", e)
+
     # Show S3 input bucket contents
     print("=== S3 Input Bucket ===")
     try:
         objs = s3.list_objects_v2(Bucket=S3_INPUT_BUCKET)
-        keys = [obj['Key'] for obj in objs.get('Contents', [])]
+        # Skip control state written by older versions, which kept it under _control/ in this bucket
+        keys = [obj['Key'] for obj in objs.get('Contents', []) if not obj['Key'].startswith('_control/')]
         print(f"Total objects: {len(keys)}")
         print("Keys:", keys)
     except Exception as e:
@@ -13,8 +13,9 @@ from key import (
 
 from config import (
     AWS_REGION,
-    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
-    EC2_KEY_PAIR_NAME, KEY_FILE_PATH
+    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
+    EC2_KEY_PAIR_NAME, KEY_FILE_PATH,
+    WEB_NODE_QUEUE_PREFIX
 )
 
 # Initialize AWS clients
@@ -48,7 +49,9 @@ def terminate_all_instances():
                     'Name': 'tag:Name',
                     'Values': [
                         'web-instance-*', # Covers web-instance-1
-                        'app-instance-*'  # Covers app-instance-X
+                        'app-instance-*', # Covers app-instance-X
+                        'app-pool-*',     # Covers the stopped warm pool instances app-pool-X
+                        'app-bake-*'      # Covers the AMI bake step's builder/test instances
                     ]
                 }
             ]
@@ -72,10 +75,30 @@ def terminate_all_instances():
         print(f"Error terminating instances: {e}")
         return False
 
+def deregister_app_images():
+    """Deregisters the App Tier AMIs baked by setup_aws.py and deletes their snapshots."""
+    print("\n--- Deregistering Baked App Tier AMIs ---")
+    try:
+        images = ec2.describe_images(Owners=['self'], Filters=[{'Name': 'name', 'Values': ['app-tier-image-*']}])['Images']
+        for image in images:
+            ec2.deregister_image(ImageId=image['ImageId'])
+            print(f"Deregistered AMI {image['ImageId']} ({image['Name']}).")
+            for mapping in image.get('BlockDeviceMappings', []):
+                snapshot_id = mapping.get('Ebs', {}).get('SnapshotId')
+                if snapshot_id:
+                    ec2.delete_snapshot(SnapshotId=snapshot_id)
+                    print(f"Deleted snapshot {snapshot_id}.")
+        if not images:
+            print("No baked App Tier AMIs found.")
+        return True
+    except Exception as e:
+        print(f"Error deregistering baked App Tier AMIs: {e}")
+        return False
+
 def delete_s3_buckets():
     """Deletes S3 buckets and their contents."""
     print("\n--- Deleting S3 Buckets ---")
-    buckets = [S3_INPUT_BUCKET, S3_OUTPUT_BUCKET]
+    buckets = [S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET]
     for bucket_name in buckets:
         try:
             # First, delete all objects in the bucket
@@ -129,10 +152,25 @@ def clear_s3_buckets():
             return False
     return True
 
+def list_node_response_queue_urls():
+    """Returns the URLs of the web nodes' own response queues (left behind by web processes that didn't shut down cleanly)."""
+    try:
+        return sqs.list_queues(QueueNamePrefix=WEB_NODE_QUEUE_PREFIX).get('QueueUrls', [])
+    except Exception as e:
+        print(f"Error listing web node response queues: {e}")
+        return []
+
 def delete_sqs_queues():
     """Deletes all project-related SQS queues."""
     print("\n--- Deleting SQS Queues ---")
     queues_to_delete = [SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME]
+
+    for queue_url in list_node_response_queue_urls():
+        try:
+            sqs.delete_queue(QueueUrl=queue_url)
+            print(f"SQS queue '{queue_url.rsplit('/', 1)[-1]}' deleted successfully.")
+        except Exception as e:
+            print(f"Error deleting SQS queue '{queue_url}': {e}")
     
     for queue_name in queues_to_delete:
         try:
@@ -155,6 +193,7 @@ def clear_sqs_queues():
     """Empties all project-related SQS queues but does NOT delete them."""
     print("\n--- Emptying SQS Queues ---")
     queues_to_clear = [SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME]
+    queues_to_clear += [queue_url.rsplit('/', 1)[-1] for queue_url in list_node_response_queue_urls()]
     for queue_name in queues_to_clear:
         try:
             response = sqs.get_queue_url(QueueName=queue_name)
@@ -266,6 +305,10 @@ if __name__ == "__main__":
         if not delete_s3_buckets():
             print("Cleanup failed at S3 bucket deletion. Please manually verify contents and then bucket.")
             exit(1)
+        # Deregister baked App Tier AMIs
+        if not deregister_app_images():
+            print("Cleanup failed at AMI deregistration. Please manually verify.")
+            exit(1)
         # Delete key pair
         if not delete_ec2_key_pair():
             print("Cleanup failed at EC2 key pair deletion. Please manually verify.")
@@ -7,6 +7,8 @@ AWS_REGION = 'ap-northeast-3'
 # S3 Bucket Names
 S3_INPUT_BUCKET = 'cse546-zhoudixin-image-input-bucket' + '-' + AWS_REGION
 S3_OUTPUT_BUCKET = 'cse546-zhoudixin-image-output-bucket' + '-' + AWS_REGION
+# Bucket for control state shared between the tiers (e.g., cancelled request IDs), so the input bucket only holds uploaded images
+S3_CONTROL_BUCKET = 'cse546-zhoudixin-control-bucket' + '-' + AWS_REGION
 
 # SQS Queue Name
 SQS_QUEUE_NAME = 'cse546-zhoudixin-image-request-queue' + '-' + AWS_REGION
@@ -27,6 +29,18 @@ APP_TIER_INSTANCE_TYPE = 't2.micro'
 # Application Directory on EC2 Instances
 REMOTE_APP_DIR = '/home/ubuntu/cse546-iaas-app' # Directory to clone/store our app code
 
+# Baked App Tier image (see `python setup_aws.py --bake_app_ami`)
+# S3 key (in the control bucket) of the record naming the baked App Tier AMI; without it App Tier instances boot from AMI_ID
+APP_IMAGE_RECORD_KEY = 'app_image.json'
+# Prefix of the S3 keys (in the control bucket) the bake step's test instance writes once its worker is ready (<prefix><instance ID>)
+APP_READY_MARKER_PREFIX = 'ready/'
+# Environment variable that makes the App Tier worker write its ready marker; only the bake step's test instance sets it
+APP_READY_MARKER_ENV = 'APP_TIER_READY_MARKER'
+# Maximum time (seconds) the bake step waits for the builder instance to install everything and power off
+APP_IMAGE_BUILD_TIMEOUT = 3600
+# Maximum time (seconds) the bake step waits for a test instance of the new image to become ready
+APP_IMAGE_READY_TIMEOUT = 900
+
 # Auto-scaling Parameters
 MAX_APP_INSTANCES = 10
 MIN_APP_INSTANCES = 0
@@ -34,10 +48,178 @@ MIN_APP_INSTANCES = 0
 MIN_INSTANCES_AT_MAX_QUEUE = 10
 # Number of messages per app instance to trigger scaling out
 MESSAGES_PER_INSTANCE = 5
+# Name prefix of the App Tier instances serving requests (app-instance-1, app-instance-2, ...)
+APP_INSTANCE_NAME_PREFIX = 'app-instance-'
+# Number of initialised App Tier instances kept stopped in the warm pool for fast scale-out (0 disables the pool)
+WARM_POOL_SIZE = 3
+# Name prefix of the warm pool's instances (app-pool-1, ...)
+WARM_POOL_NAME_PREFIX = 'app-pool-'
 # Time interval (seconds) for the auto-scaling controller to check SQS queue depth
 SCALING_CHECK_INTERVAL = 15
 # Number of messages in queue considered "max depth" (adjust based on expected load)
 MAX_QUEUE_DEPTH_THRESHOLD = 50
+# Auto-scaling policy (see autoscaling.py): 'predictive', 'proportional', 'latency_slo', or 'threshold' for the original all-or-nothing rule
+AUTOSCALING_POLICY = 'predictive'
+# Minimum time (seconds) between two scale-out steps
+SCALE_OUT_COOLDOWN = 30
+# Minimum time (seconds) after any scaling step before instances are terminated
+SCALE_IN_COOLDOWN = 60
+# Hysteresis band: scale in only once the remaining instances would have fewer than (1 - band) * MESSAGES_PER_INSTANCE messages each
+SCALING_HYSTERESIS = 0.4
+# Maximum number of instances launched in one scale-out step
+SCALE_OUT_MAX_STEP = 5
+# Maximum number of instances terminated in one scale-in step
+SCALE_IN_MAX_STEP = 2
+# Queue depth above which the 'threshold' policy scales out to MAX_APP_INSTANCES
+THRESHOLD_POLICY_QUEUE_DEPTH = 10
+# Smoothing factors of the 'predictive' policy's arrival rate forecaster (level, trend; 0-1, higher reacts faster)
+PREDICTIVE_LEVEL_SMOOTHING = 0.5
+PREDICTIVE_TREND_SMOOTHING = 0.3
+# Requests per second one app instance is assumed to serve until it has been measured under load
+PREDICTIVE_INSTANCE_SERVICE_RATE = 1.0
+# Time (seconds) from launching an app instance to its first response, assumed until one has been measured
+PREDICTIVE_DEFAULT_BOOT_LATENCY = 300
+# Spare capacity the 'predictive' policy provisions on top of the forecast arrival rate (fraction)
+PREDICTIVE_HEADROOM = 0.2
+# p95 end-to-end request latency (seconds) the 'latency_slo' policy sizes the App Tier for
+SLO_P95_LATENCY = 10
+# Request latency (seconds) without queueing, assumed by the 'latency_slo' policy until latencies have been observed
+SLO_DEFAULT_BASE_LATENCY = 2
+# Window (seconds) over which the observed request latency percentiles are computed
+SLO_LATENCY_WINDOW = 120
+
+# App Tier worker batching
+# Maximum number of downloaded images classified together in one forward pass
+WORKER_MAX_BATCH_SIZE = 10
+# Maximum time (seconds) to keep collecting images for a partial batch after the first one is ready
+WORKER_MAX_BATCH_WAIT = 0.5
+
+# App Tier worker pipeline (receive -> download -> infer -> upload stages)
+# Number of threads prefetching images from S3 while the current batch is inferring
+WORKER_DOWNLOAD_THREADS = 4
+# Number of threads uploading results to S3 and the response queue in the background
+WORKER_UPLOAD_THREADS = 4
+# Hard cap on request messages received but not yet finished by one worker
+WORKER_MAX_IN_FLIGHT = 40
+# In-flight work must be finishable within this fraction of the request queue's visibility timeout
+WORKER_VISIBILITY_SAFETY_FACTOR = 0.5
+# Maximum time (seconds) a completed result waits to be batched with others into one SQS send/delete call
+WORKER_SQS_BATCH_MAX_DELAY = 0.1
+# Time (seconds) after which the send batcher of a response queue no request was answered on is closed
+# (web nodes get a new response queue on every restart, so old ones stop being used)
+WORKER_RESPONSE_BATCHER_IDLE_TIMEOUT = 600
+# Maximum total time (seconds) the visibility of an in-flight request message is extended while it's processed
+WORKER_MAX_VISIBILITY_EXTENSION = 900
+# Time interval (seconds) between worker statistics log lines
+WORKER_STATS_INTERVAL = 60
+# Decode images straight from S3 bytes in memory instead of writing them to /tmp/image_processing
+WORKER_IN_MEMORY_IMAGES = True
+
+# Image preprocessing (image_classification.py)
+# Square input size images are resized/cropped to before inference, with reduced-resolution JPEG decoding.
+# None keeps every image at its native size, exactly like the original ToTensor pipeline.
+CLASSIFIER_INPUT_SIZE = None
+# Apply ImageNet mean/std normalisation on top of the [0, 1] scaling (the original pipeline does not)
+CLASSIFIER_NORMALIZE = False
+# Maximum fraction of sample images whose label may differ from the reference pipeline
+CLASSIFIER_PREPROCESS_TOLERANCE = 0.02
+# Folder of sample images used by the worker at startup to check CLASSIFIER_INPUT_SIZE and to
+# calibrate/check CLASSIFIER_MODEL_VARIANT ('' = no samples: skip the preprocessing check, fp32 only)
+CLASSIFIER_SAMPLE_DIR = ''
+# Inference backend: 'torch' or 'onnxruntime' (see inference_backends.py)
+CLASSIFIER_BACKEND = 'torch'
+# ONNX model used by the onnxruntime backend, produced by `python export_onnx.py` (relative to the app directory)
+CLASSIFIER_ONNX_PATH = 'resnet18.onnx'
+# ResNet-18 variant used by the torch backend: 'fp32', 'torchscript', 'int8_dynamic' or 'int8_static' (see model_variants.py)
+CLASSIFIER_MODEL_VARIANT = 'fp32'
+# Minimum top-1 agreement with the fp32 model on the sample images for a variant to be activated
+CLASSIFIER_VARIANT_MIN_AGREEMENT = 0.98
+
+# App Tier worker pool (app_tier_supervisor.py)
+# Number of worker processes per app instance (0 = auto-detect from the CPU count)
+APP_WORKER_PROCESSES = 0
+# Inference (torch/onnxruntime intra-op) threads per worker process (0 = split the CPU cores evenly between the workers)
+APP_TORCH_THREADS_PER_WORKER = 0
+# Seconds without a heartbeat after which a worker process is considered hung and restarted
+APP_WORKER_HEARTBEAT_TIMEOUT = 120
+# Time interval (seconds) between supervisor health checks/reports
+APP_SUPERVISOR_CHECK_INTERVAL = 15
+
+# Size of the Web Tier's thread pool (and AWS connection pools) for blocking boto3 calls;
+# bounds how many S3/SQS/EC2 calls can be in flight at once across all requests
+WEB_AWS_IO_THREADS = 64
+
+# Web Tier admission control
+# Default time (seconds) an upload waits for its result before failing with 504;
+# clients can ask for less with the ?timeout= query parameter. Workers drop requests past their deadline.
+WEB_REQUEST_TIMEOUT = 120
+# Maximum number of uploads processed at once; further uploads get 429 Too Many Requests
+WEB_MAX_IN_FLIGHT = 1000
+# Upper bound (seconds) of the Retry-After sent with 429 responses
+WEB_MAX_RETRY_AFTER = 60
+# Time window (seconds) the App Tier's service rate is estimated over (for Retry-After)
+WEB_SERVICE_RATE_WINDOW = 60
+# Time interval (seconds) between sweeps of pending requests past their deadline
+WEB_JANITOR_INTERVAL = 5
+# Maximum number of files in one /upload_batch request
+WEB_MAX_BATCH_FILES = 500
+
+# Request cancellation (clients that disconnect or time out)
+# Time interval (seconds) between checks of a waiting client's connection
+WEB_DISCONNECT_CHECK_INTERVAL = 1
+# Time interval (seconds) between publishes of the recently cancelled request set (only sent when it changed)
+WEB_CANCELLATION_PUBLISH_INTERVAL = 0.5
+# Time interval (seconds) between App Tier polls of the cancelled request set
+WORKER_CANCELLATION_POLL_INTERVAL = 1
+
+# Enqueue coalescer: request messages sent within this window (seconds) share one send_message_batch call
+WEB_ENQUEUE_BATCH_WINDOW = 0.005
+# Number of send_message_batch calls the coalescer can have in flight at once
+WEB_ENQUEUE_FLUSH_THREADS = 4
+
+# Images of at most this many bytes are sent base64-encoded inside the request SQS message
+# instead of through the S3 input bucket (0 disables inlining). Base64 grows the payload by 4/3,
+# so keep this well below 192 KB to stay within SQS's 256 KB message limit.
+WEB_INLINE_IMAGE_MAX_BYTES = 96 * 1024
+
+# Web Tier result cache (keyed by the SHA-256 of the uploaded image bytes)
+# Maximum number of cached results (least recently used are evicted first)
+WEB_RESULT_CACHE_SIZE = 10000
+# Time (seconds) a cached result stays valid
+WEB_RESULT_CACHE_TTL = 3600
+
+# Web Tier scale-out (several web processes and/or instances)
+# Give every web process its own response queue (named WEB_NODE_QUEUE_PREFIX + a random node ID,
+# deleted on shutdown) and send its URL with each request, so workers answer the process that waits
+WEB_PER_NODE_RESPONSE_QUEUES = True
+# Prefix of the per-node response queue names (cleanup_aws.py deletes every queue with this prefix)
+WEB_NODE_QUEUE_PREFIX = RESPONSE_SQS_QUEUE_NAME + '-node-'
+# Whether this web instance runs the auto-scaling controller (enable it on exactly one instance);
+# the uvicorn worker processes of that instance elect one controller through a file lock
+WEB_RUN_AUTOSCALER = True
+WEB_AUTOSCALER_LOCK_PATH = '/tmp/web-tier-autoscaler.lock'
+# Prefix of the S3 keys (in the control bucket) where every web process publishes its arrival and service rates
+# and the App Tier instances it heard from, so the auto-scaling controller sees the whole Web Tier, not only its own process
+WEB_STATS_PREFIX = 'web-stats/'
+# Web process stats not updated for this long (seconds) are ignored (the process has exited)
+WEB_STATS_MAX_AGE = 3 * SCALING_CHECK_INTERVAL
+# Number of uvicorn worker processes per web instance (0 = one per CPU core).
+# Keep it at 1 while the job API is used: jobs live in the memory of the process that created them,
+# so GET /jobs/<id> and /jobs/stream only find a job when they reach that same process
+WEB_UVICORN_WORKERS = 1
+
+# Web Tier job API (POST /jobs, GET /jobs/{id}, GET /jobs/stream)
+# Default time (seconds) a job may wait for its result; clients can ask for less with ?timeout=
+WEB_JOB_TIMEOUT = 900
+# Maximum number of jobs still waiting for a result; further submissions get 429
+WEB_MAX_PENDING_JOBS = 20000
+# Maximum number of finished jobs kept, and how long (seconds) each is kept after it finished
+WEB_JOB_STORE_SIZE = 100000
+WEB_JOB_TTL = 3600
+# Longest long-poll wait (seconds) GET /jobs/{id}?wait= accepts
+WEB_JOB_MAX_WAIT = 30
+# Time interval (seconds) between keep-alive comments on an idle result stream
+WEB_SSE_KEEPALIVE_INTERVAL = 15
 
 # Paths for local files
 KEY_FILE_PATH = f"{EC2_KEY_PAIR_NAME}.pem"
@@ -45,8 +227,15 @@ KEY_FILE_PATH = f"{EC2_KEY_PAIR_NAME}.pem"
 # Web Tier Public IP placeholder (will be filled after instance creation)
 WEB_TIER_PUBLIC_IP = "" # No longer directly used by user, but still useful for workload generator setup
 
-# Polling interval and timeout for Web Tier to retrieve results from S3
-WEB_TIER_POLLING_INTERVAL = 1 # seconds
+# Web Tier response dispatcher
+# Number of concurrent long-pollers receiving results from the response queue
+WEB_RESPONSE_POLLERS = 4
+# SQS long-poll wait (seconds, max 20); a receive returns as soon as a message arrives
+WEB_RESPONSE_WAIT_TIME = 20
+# Maximum time (seconds) a received response waits to be acknowledged in a delete_message_batch call
+WEB_RESPONSE_DELETE_MAX_DELAY = 0.05
+# Number of recent responses the delivery-lag percentiles are computed over
+WEB_RESPONSE_LAG_WINDOW = 1000
 
 GIT_REPO_URL = 'https://github.com/jooewood/p2-1.git'
 
@@ -0,0 +1,69 @@
+# export_onnx.py
+
+import argparse
+import logging
+
+import numpy as np
+import torch
+
+from config import (
+    CLASSIFIER_ONNX_PATH, CLASSIFIER_INPUT_SIZE, CLASSIFIER_NORMALIZE
+)
+from inference_backends import create_backend, resolve_path
+from model_variants import build_fp32_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def export_onnx(output_path, opset_version=17):
+    """
+    Exports the fp32 ResNet-18 to ONNX for the onnxruntime backend.
+    Batch size, height and width are dynamic axes so native-size images can be batched as they are today.
+    Returns the exported torch model.
+    """
+    model = build_fp32_model()
+    dummy_input = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(
+        model,
+        dummy_input,
+        output_path,
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'}, 'logits': {0: 'batch'}},
+        opset_version=opset_version
+    )
+    logging.info(f"Exported ResNet-18 to {output_path} (opset {opset_version}).")
+    return model
+
+def verify_export(model, output_path, batches):
+    """Returns the top-1 agreement between the torch model and the exported graph run by onnxruntime."""
+    backend = create_backend('onnxruntime', onnx_path=output_path)
+    matches = 0
+    total = 0
+    for batch in batches:
+        with torch.no_grad():
+            expected = torch.max(model(torch.from_numpy(batch)), 1)[1].numpy()
+        matches += int((backend.predict(batch) == expected).sum())
+        total += batch.shape[0]
+    return matches / total if total else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export ResNet-18 to ONNX for the onnxruntime inference backend')
+    parser.add_argument('--output', type=str, default=CLASSIFIER_ONNX_PATH, help='Path of the ONNX file to write')
+    parser.add_argument('--samples', type=str, help='Folder of sample images to verify the export on (default: random inputs)')
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+
+    output_path = resolve_path(args.output)
+    model = export_onnx(output_path, args.opset)
+
+    if args.samples:
+        from image_classification import list_images, preprocess_batch
+        image_paths = list_images(args.samples)
+        batches = [batch for start in range(0, len(image_paths), 10)
+                   for _, batch in preprocess_batch(image_paths[start:start + 10], CLASSIFIER_INPUT_SIZE, CLASSIFIER_NORMALIZE)]
+    else:
+        batches = [np.random.rand(4, 3, 224, 224).astype(np.float32), np.random.rand(2, 3, 320, 240).astype(np.float32)]
+    agreement = verify_export(model, output_path, batches)
+    print(f"Top-1 agreement between torch and onnxruntime: {agreement:.4f}")
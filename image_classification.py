@@ -1,31 +1,210 @@
-import torch
-import torchvision
-import torchvision.transforms as transforms
-import torch.nn as nn
-import torch.nn.functional as F
-import torchvision.models as models
+
 from urllib.request import urlopen
 from PIL import Image
 import numpy as np
+import argparse
+import io
 import json
+import os
 import sys
 import time
 
-url = str(sys.argv[1])
-#img = Image.open(urlopen(url))
-img = Image.open(url)
+from config import (
+    CLASSIFIER_INPUT_SIZE, CLASSIFIER_NORMALIZE, CLASSIFIER_PREPROCESS_TOLERANCE,
+    CLASSIFIER_MODEL_VARIANT, CLASSIFIER_BACKEND
+)
+from inference_backends import create_backend
+
+# Labels file lives next to this script so the engine works regardless of the caller's cwd
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imagenet-labels.json')
+
+# ImageNet channel statistics, used when CLASSIFIER_NORMALIZE is enabled
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+
+
+def open_image(image, input_size=None):
+    """
+    Opens an image given as encoded bytes, a file path or a PIL image, without loading its pixels yet.
+    If input_size is set and the image is a JPEG, PIL's draft mode is used so the decoder
+    scales the image down by 1/2, 1/4 or 1/8 while decoding, as long as both sides stay >= input_size.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    elif not isinstance(image, Image.Image):
+        image = Image.open(image)
+    if input_size and image.format == 'JPEG':
+        image.draft('RGB', (input_size, input_size))
+    return image
+
+def decode_image(image_bytes, input_size=None):
+    """
+    Decodes encoded image bytes (e.g., a JPEG fetched from S3) into a PIL image without touching disk.
+    The pixels are loaded eagerly so the caller can drop the compressed bytes immediately.
+    input_size enables reduced-resolution JPEG decoding (see open_image).
+    """
+    image = open_image(image_bytes, input_size)
+    image.load()
+    return image
+
+def resize_and_center_crop(image, input_size):
+    """Resizes the shorter side of an image to input_size and center crops it to input_size x input_size."""
+    width, height = image.size
+    scale = input_size / min(width, height)
+    new_width, new_height = max(input_size, round(width * scale)), max(input_size, round(height * scale))
+    if (new_width, new_height) != (width, height):
+        image = image.resize((new_width, new_height), Image.BILINEAR)
+    left = (new_width - input_size) // 2
+    top = (new_height - input_size) // 2
+    return image.crop((left, top, left + input_size, top + input_size))
+
+def preprocess_batch(images, input_size=None, normalize=False):
+    """
+    Turns a list of images (encoded bytes, file paths or PIL images) into contiguous
+    float32 batch arrays of shape (N, 3, H, W) with values scaled to [0, 1]
+    (and ImageNet mean/std normalised if `normalize` is set).
+    Returns a list of (indices, batch) pairs:
+    - with input_size, every image is resized/cropped to input_size x input_size and
+      the result is a single batch covering all images;
+    - without it, images keep their native size (as the reference ToTensor pipeline does)
+      and one batch is produced per distinct image size.
+    The output arrays are preallocated and filled in place, one image at a time.
+    """
+    rgb_images = []
+    for image in images:
+        image = open_image(image, input_size)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if input_size:
+            image = resize_and_center_crop(image, input_size)
+        rgb_images.append(image)
+
+    # Group image indices by size so each group can be written into one array
+    groups = {}
+    for index, image in enumerate(rgb_images):
+        groups.setdefault(image.size, []).append(index)
+
+    batches = []
+    scale = np.float32(255)
+    for (width, height), indices in groups.items():
+        batch = np.empty((len(indices), 3, height, width), dtype=np.float32)
+        for position, index in enumerate(indices):
+            pixels = np.asarray(rgb_images[index], dtype=np.uint8) # (H, W, 3)
+            np.divide(pixels.transpose(2, 0, 1), scale, out=batch[position], casting='unsafe')
+        if normalize:
+            batch -= IMAGENET_MEAN
+            batch /= IMAGENET_STD
+        batches.append((indices, batch))
+    return batches
+
+
+class ImageClassifier:
+    """
+    Long-lived ResNet-18 classifier.
+    The model and the ImageNet labels are loaded once at construction time,
+    so repeated classify() calls only pay for the forward pass.
+    input_size/normalize configure the vectorised preprocessing (see preprocess_batch);
+    backend selects the inference backend (see inference_backends.py) and model_variant
+    the ResNet-18 variant it runs, which is calibrated and checked on sample_images.
+    The defaults come from config.py.
+    """
+
+    def __init__(self, labels_path=LABELS_PATH, input_size=CLASSIFIER_INPUT_SIZE, normalize=CLASSIFIER_NORMALIZE,
+                 backend=CLASSIFIER_BACKEND, model_variant=CLASSIFIER_MODEL_VARIANT, sample_images=None, num_threads=None):
+        self.input_size = input_size
+        self.normalize = normalize
+        with open(labels_path) as f:
+            self.labels = json.load(f)
+
+        self.backend = create_backend(
+            backend,
+            model_variant=model_variant,
+            sample_batches=self.sample_batches(sample_images or []),
+            num_threads=num_threads
+        )
+
+    def sample_batches(self, image_paths, batch_size=10):
+        """Preprocesses sample images into batches of at most batch_size images."""
+        batches = []
+        for start in range(0, len(image_paths), batch_size):
+            for _, batch in preprocess_batch(image_paths[start:start + batch_size], self.input_size, self.normalize):
+                batches.append(batch)
+        return batches
+
+    def decode(self, image_bytes):
+        """Decodes image bytes with this classifier's reduced-resolution settings (see decode_image)."""
+        return decode_image(image_bytes, self.input_size)
+
+    def classify(self, image):
+        """
+        Classifies a single image and returns its label.
+        image: encoded image bytes, a path to an image file or an already opened PIL image.
+        """
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images):
+        """
+        Classifies a list of images and returns their labels in the same order.
+        The images are preprocessed into contiguous batch arrays and each array is run
+        through the model in a single forward pass.
+        """
+        results = [None] * len(images)
+        for indices, batch in preprocess_batch(images, self.input_size, self.normalize):
+            for i, label_index in zip(indices, self.backend.predict(batch)):
+                results[i] = self.labels[label_index]
+        return results
+
+    def classify_reference(self, image):
+        """
+        Classifies a single image with reference preprocessing: full-resolution decode at native size,
+        which feeds the model exactly what the original ToTensor pipeline did.
+        """
+        _, batch = preprocess_batch([image], None, self.normalize)[0]
+        return self.labels[self.backend.predict(batch)[0]]
+
+    def check_preprocessing(self, image_paths, tolerance=CLASSIFIER_PREPROCESS_TOLERANCE):
+        """
+        Compares the labels produced by the configured preprocessing with the reference pipeline.
+        Returns (agreement, within_tolerance), where agreement is the fraction of images whose
+        labels match and within_tolerance tells whether 1 - agreement <= tolerance.
+        """
+        if not image_paths:
+            return 1.0, True
+        matches = 0
+        for image_path in image_paths:
+            if self.classify(image_path) == self.classify_reference(image_path):
+                matches += 1
+        agreement = matches / len(image_paths)
+        return agreement, (1 - agreement) <= tolerance
+
+
+def list_images(folder):
+    """Returns the paths of the image files in a folder, sorted by name."""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png')
+    )
+
 
-model = models.resnet18(pretrained=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Classify an image with ResNet-18')
+    parser.add_argument('image', type=str, nargs='?', help='Path to the image to classify')
+    parser.add_argument('--check_preprocess', type=str, help='Folder of sample images to compare the configured preprocessing against the reference pipeline')
+    args = parser.parse_args()
 
-model.eval()
-img_tensor = transforms.ToTensor()(img).unsqueeze_(0)
-outputs = model(img_tensor)
-_, predicted = torch.max(outputs.data, 1)
+    classifier = ImageClassifier()
+    if args.check_preprocess:
+        agreement, within_tolerance = classifier.check_preprocessing(list_images(args.check_preprocess))
+        print(f"Top-1 agreement with reference preprocessing (input size {classifier.input_size}): {agreement:.4f}")
+        print(f"Within tolerance ({CLASSIFIER_PREPROCESS_TOLERANCE}): {within_tolerance}")
+        sys.exit(0 if within_tolerance else 1)
+    if not args.image:
+        parser.error("an image path is required")
 
-with open('./imagenet-labels.json') as f:
-    labels = json.load(f)
-result = labels[np.array(predicted)[0]]
-img_name = url.split("/")[-1]
-#save_name = f"({img_name}, {result})"
-save_name = f"{img_name},{result}"
-print(f"{save_name}")
\ No newline at end of file
+    url = args.image
+    #img = Image.open(urlopen(url))
+    result = classifier.classify(url)
+    img_name = url.split("/")[-1]
+    #save_name = f"({img_name}, {result})"
+    save_name = f"{img_name},{result}"
+    print(f"{save_name}")
@@ -0,0 +1,110 @@
+# inference_backends.py
+
+import logging
+import os
+
+import numpy as np
+
+from config import (
+    CLASSIFIER_ONNX_PATH
+)
+
+# Registry of inference backends by name (filled by @register_backend)
+INFERENCE_BACKENDS = {}
+
+
+def register_backend(name):
+    """Class decorator registering an InferenceBackend subclass under `name`."""
+    def decorator(cls):
+        cls.name = name
+        INFERENCE_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+def create_backend(name, **kwargs):
+    """Instantiates the backend registered under `name`."""
+    if name not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'. Available backends: {sorted(INFERENCE_BACKENDS)}.")
+    return INFERENCE_BACKENDS[name](**kwargs)
+
+def resolve_path(path):
+    """Resolves a path relative to this file's directory (where the model files live on the app instances)."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+class InferenceBackend:
+    """
+    Interface of an inference backend.
+    A backend takes a preprocessed float32 batch of shape (N, 3, H, W) and returns the
+    top-1 ImageNet class index of every image as an int array of shape (N,).
+    Backends are constructed with the keyword arguments:
+    - model_variant: model variant requested by the configuration (backends may ignore it)
+    - sample_batches: list of preprocessed sample batches for calibration/checks (may be empty)
+    - num_threads: number of intra-op threads to use (None = runtime default)
+    """
+
+    name = None
+
+    def __init__(self, model_variant='fp32', sample_batches=None, num_threads=None):
+        self.description = self.name
+
+    def predict(self, batch):
+        """Returns the top-1 class index of every image in the batch."""
+        raise NotImplementedError
+
+
+@register_backend('torch')
+class TorchBackend(InferenceBackend):
+    """PyTorch ResNet-18 in any of the variants from model_variants.py (fp32 eager by default)."""
+
+    def __init__(self, model_variant='fp32', sample_batches=None, num_threads=None):
+        import torch
+        from model_variants import build_fp32_model, activate_model_variant
+
+        self.torch = torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError as e:
+                logging.warning(f"Could not set torch inter-op threads: {e}")
+
+        torch_batches = [torch.from_numpy(batch) for batch in (sample_batches or [])]
+        fp32_model = build_fp32_model()
+        self.model, self.model_variant, self.variant_agreement = activate_model_variant(model_variant, fp32_model, torch_batches)
+        self.description = f"torch ({self.model_variant})"
+
+    def predict(self, batch):
+        with self.torch.no_grad():
+            outputs = self.model(self.torch.from_numpy(batch))
+        _, predicted = self.torch.max(outputs.data, 1)
+        return predicted.numpy()
+
+
+@register_backend('onnxruntime')
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    ONNX Runtime on CPU, running the ResNet-18 graph exported by export_onnx.py.
+    Doesn't import torch at all, which keeps worker start-up time and memory down.
+    """
+
+    def __init__(self, model_variant='fp32', sample_batches=None, num_threads=None, onnx_path=CLASSIFIER_ONNX_PATH):
+        import onnxruntime
+
+        if model_variant != 'fp32':
+            logging.warning(f"The onnxruntime backend runs the exported fp32 graph; ignoring model variant '{model_variant}'.")
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+            session_options.inter_op_num_threads = 1
+        onnx_path = resolve_path(onnx_path)
+        self.session = onnxruntime.InferenceSession(onnx_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.description = f"onnxruntime ({os.path.basename(onnx_path)})"
+
+    def predict(self, batch):
+        outputs = self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+        return outputs.argmax(axis=1)
@@ -0,0 +1,80 @@
+# message_protocol.py
+
+import base64
+import json
+
+# SQS rejects message bodies larger than 256 KB
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+
+# Version of the JSON request body written by encode_request
+REQUEST_FORMAT_VERSION = 1
+
+
+def encode_request(unique_input_s3_key, original_filename, unique_request_id, image_bytes=None, deadline=None, reply_to=None, node=None):
+    """
+    Builds the body of a request SQS message.
+    unique_input_s3_key names the request's image: the S3 input object the worker downloads,
+    or, when image_bytes is given, just a unique name for the image, whose bytes then travel
+    base64-encoded inside the message instead of through S3.
+    deadline (epoch seconds) is when the web tier stops waiting for the result;
+    workers drop requests that are past it.
+    reply_to is the URL of the response queue of the web node waiting for the result
+    (workers answer on the shared response queue without it), and node that node's ID.
+    """
+    body = {
+        'v': REQUEST_FORMAT_VERSION,
+        'key': unique_input_s3_key,
+        'filename': original_filename,
+        'request_id': unique_request_id,
+    }
+    if deadline is not None:
+        body['deadline'] = round(deadline, 3)
+    if reply_to is not None:
+        body['reply_to'] = reply_to
+    if node is not None:
+        body['node'] = node
+    if image_bytes is not None:
+        body['image'] = base64.b64encode(image_bytes).decode('ascii')
+    return json.dumps(body, separators=(',', ':'))
+
+def fits_in_message(message_body):
+    """Tells whether a message body is within SQS's message size limit."""
+    return len(message_body.encode('utf-8')) <= SQS_MAX_MESSAGE_BYTES
+
+def decode_request(message_body):
+    """
+    Parses the body of a request SQS message, in either the JSON format written by encode_request
+    or the legacy "unique_input_s3_key,original_filename,unique_request_id" format.
+    Returns a dict with 'unique_input_s3_key', 'original_filename', 'unique_request_id',
+    'image_bytes' (the inline image, or None if the image is in S3), 'deadline', 'reply_to' and 'node'
+    (each None if the request has none), or None if the body is malformed.
+    """
+    if message_body.startswith('{'):
+        try:
+            body = json.loads(message_body)
+            image = body.get('image')
+            return {
+                'unique_input_s3_key': body['key'],
+                'original_filename': body['filename'],
+                'unique_request_id': body['request_id'],
+                'image_bytes': base64.b64decode(image, validate=True) if image is not None else None,
+                'deadline': float(body['deadline']) if body.get('deadline') is not None else None,
+                'reply_to': body.get('reply_to'),
+                'node': body.get('node'),
+            }
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    # Legacy format, e.g. "uuid-test_0.JPEG,test_0.JPEG,test_0-uuid"
+    message_parts = message_body.split(',', 2) # Split at most twice
+    if len(message_parts) != 3:
+        return None
+    return {
+        'unique_input_s3_key': message_parts[0],
+        'original_filename': message_parts[1],
+        'unique_request_id': message_parts[2],
+        'image_bytes': None,
+        'deadline': None,
+        'reply_to': None,
+        'node': None,
+    }
@@ -0,0 +1,168 @@
+# model_variants.py
+
+import argparse
+import copy
+import logging
+import time
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+import torchvision.models.quantization as quantized_models
+
+from config import (
+    CLASSIFIER_INPUT_SIZE, CLASSIFIER_NORMALIZE,
+    CLASSIFIER_VARIANT_MIN_AGREEMENT
+)
+
+# Selectable ResNet-18 variants:
+# - fp32: the eager float32 torchvision model (reference)
+# - torchscript: scripted and frozen graph of the fp32 model, optimised for inference
+# - int8_dynamic: dynamically quantized INT8 (weights of the Linear layer; activations quantized on the fly)
+# - int8_static: statically quantized INT8 (fused conv/bn/relu, activation ranges calibrated on sample images)
+MODEL_VARIANTS = ('fp32', 'torchscript', 'int8_dynamic', 'int8_static')
+
+
+def select_quantized_engine():
+    """Picks the quantized kernel backend for this CPU (fbgemm on x86, qnnpack on ARM)."""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('fbgemm', 'x86', 'qnnpack'):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    return None
+
+def build_fp32_model():
+    """Builds the eager float32 reference model."""
+    model = models.resnet18(pretrained=True)
+    model.eval()
+    return model
+
+def build_torchscript_model(fp32_model, calibration_batches):
+    """
+    Scripts and freezes the fp32 model.
+    The calibration batches are run through the frozen graph once so the JIT's profiling
+    executor specialises it before real traffic arrives.
+    """
+    scripted = torch.jit.script(copy.deepcopy(fp32_model).eval())
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            frozen(batch)
+    return frozen
+
+def build_int8_dynamic_model(fp32_model, calibration_batches):
+    """
+    Dynamically quantizes the fp32 model to INT8.
+    Dynamic quantization needs no calibration (activation ranges are computed per batch);
+    in ResNet-18 it applies to the final Linear layer only, the convolutions stay fp32.
+    """
+    select_quantized_engine()
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(fp32_model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+def build_int8_static_model(fp32_model, calibration_batches):
+    """
+    Statically quantizes ResNet-18 to INT8.
+    Uses torchvision's quantizable ResNet-18 (with quant/dequant stubs), fuses conv/bn/relu,
+    records activation ranges on the calibration batches and converts to INT8 kernels.
+    """
+    if not calibration_batches:
+        raise ValueError("Static quantization needs calibration images.")
+    engine = select_quantized_engine()
+    model = quantized_models.resnet18(pretrained=False, quantize=False)
+    model.load_state_dict(fp32_model.state_dict())
+    model.eval()
+    model.fuse_model()
+    model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(model, inplace=True)
+    with torch.no_grad():
+        for batch in calibration_batches:
+            model(batch)
+    torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+VARIANT_BUILDERS = {
+    'torchscript': build_torchscript_model,
+    'int8_dynamic': build_int8_dynamic_model,
+    'int8_static': build_int8_static_model,
+}
+
+def top1_agreement(reference_model, candidate_model, batches):
+    """Returns the fraction of sample images on which both models predict the same top-1 class."""
+    matches = 0
+    total = 0
+    with torch.no_grad():
+        for batch in batches:
+            reference = torch.max(reference_model(batch), 1)[1]
+            candidate = torch.max(candidate_model(batch), 1)[1]
+            matches += int((reference == candidate).sum())
+            total += batch.shape[0]
+    return matches / total if total else 0.0
+
+def build_model_variant(variant, fp32_model, calibration_batches):
+    """Builds a model variant from the fp32 model (fp32 returns the model itself)."""
+    if variant == 'fp32':
+        return fp32_model
+    if variant not in VARIANT_BUILDERS:
+        raise ValueError(f"Unknown model variant '{variant}'. Choose one of {MODEL_VARIANTS}.")
+    return VARIANT_BUILDERS[variant](fp32_model, calibration_batches)
+
+def activate_model_variant(variant, fp32_model, sample_batches, min_agreement=CLASSIFIER_VARIANT_MIN_AGREEMENT):
+    """
+    Builds the requested variant, calibrates it on the sample batches and checks its
+    top-1 agreement with the fp32 model on the same samples.
+    Returns (model, active_variant, agreement). Falls back to the fp32 model if the variant
+    can't be built, there are no samples to check it on, or its agreement is below min_agreement.
+    """
+    if variant == 'fp32':
+        return fp32_model, 'fp32', 1.0
+    if not sample_batches:
+        logging.warning(f"No sample images to check model variant '{variant}' against fp32. Refusing to activate it; using fp32.")
+        return fp32_model, 'fp32', None
+    try:
+        model = build_model_variant(variant, fp32_model, sample_batches)
+    except Exception as e:
+        logging.error(f"Failed to build model variant '{variant}': {e}. Using fp32.")
+        return fp32_model, 'fp32', None
+
+    agreement = top1_agreement(fp32_model, model, sample_batches)
+    if agreement < min_agreement:
+        logging.warning(f"Model variant '{variant}' agrees with fp32 on only {agreement:.2%} of the samples (minimum {min_agreement:.2%}). Refusing to activate it; using fp32.")
+        return fp32_model, 'fp32', agreement
+    logging.info(f"Activated model variant '{variant}' ({agreement:.2%} top-1 agreement with fp32).")
+    return model, variant, agreement
+
+def measure_throughput(model, batches, repeats=3):
+    """Returns the images/second a model achieves on the sample batches."""
+    images = sum(batch.shape[0] for batch in batches) * repeats
+    start_time = time.time()
+    with torch.no_grad():
+        for _ in range(repeats):
+            for batch in batches:
+                model(batch)
+    elapsed = time.time() - start_time
+    return images / elapsed if elapsed > 0 else 0.0
+
+
+if __name__ == "__main__":
+    from image_classification import list_images, preprocess_batch
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Compare ResNet-18 variants against the fp32 model')
+    parser.add_argument('--samples', type=str, help='Folder of sample images used for calibration and the agreement check', required=True)
+    parser.add_argument('--variants', type=str, nargs='+', default=list(MODEL_VARIANTS), choices=MODEL_VARIANTS)
+    parser.add_argument('--batch_size', type=int, default=10)
+    args = parser.parse_args()
+
+    image_paths = list_images(args.samples)
+    sample_batches = []
+    for start in range(0, len(image_paths), args.batch_size):
+        for _, batch in preprocess_batch(image_paths[start:start + args.batch_size], CLASSIFIER_INPUT_SIZE, CLASSIFIER_NORMALIZE):
+            sample_batches.append(torch.from_numpy(batch))
+
+    fp32_model = build_fp32_model()
+    print(f"{'variant':<14}{'agreement':>10}{'images/s':>10}  activated")
+    for variant in args.variants:
+        model, active_variant, agreement = activate_model_variant(variant, fp32_model, sample_batches)
+        agreement_text = f"{agreement:.4f}" if agreement is not None else "n/a"
+        print(f"{variant:<14}{agreement_text:>10}{measure_throughput(model, sample_batches):>10.1f}  {active_variant == variant}")
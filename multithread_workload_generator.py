@@ -21,10 +21,15 @@ def compute_accuracy(results):
     accuracy = correct / total if total > 0 else 0
     print(f"{accuracy:.4f} ({correct}/{total})")
 
-def send_one_request(image_path):
-    file = {"myfile": open(image_path, 'rb')}
-    r = requests.post(args.url, files=file)
+def send_one_request(image_path, salt=None):
+    # salt: bytes appended after the image data (decoders ignore them), so the web tier's result cache,
+    # keyed by the image's hash, doesn't answer the request
     image_name = os.path.basename(image_path)
+    with open(image_path, 'rb') as f:
+        content = f.read()
+    if salt is not None:
+        content += salt
+    r = requests.post(args.url, files={"myfile": (image_name, content)})
     if r.status_code != 200:
         print('sendErr: ' + r.url)
         return (image_name, None)
@@ -39,6 +44,7 @@ if __name__ == "__main__":
     parser.add_argument('--num_request', type=int, help='one image per request', required=True)
     parser.add_argument('--url', type=str, help='URL to the backend server, e.g. http://3.86.108.221/upload', required=True)
     parser.add_argument('--image_folder', type=str, help='Path to the folder containing images', required=True)
+    parser.add_argument('--concurrency', type=int, nargs='+', help='Sweep these client concurrency levels and report requests/sec for each (default: one thread per request)')
     args = parser.parse_args()
 
     start_time = time.time()
@@ -50,13 +56,35 @@ if __name__ == "__main__":
             break
         image_path_list.append(os.path.join(args.image_folder, name))
 
-    results = []
-    with ThreadPoolExecutor(max_workers=num_max_workers) as executor:
-        futures = [executor.submit(send_one_request, path) for path in image_path_list]
-        for future in as_completed(futures):
-            result = future.result()
-            if result is not None:
-                results.append(result)
+    def run_workload(max_workers, salt=None):
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(send_one_request, path, salt) for path in image_path_list]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is not None:
+                    results.append(result)
+        return results
+
+    if args.concurrency:
+        sweep = []
+        run_id = str(time.time_ns())
+        for level, concurrency in enumerate(args.concurrency):
+            level_start = time.time()
+            # Every level sends different bytes, so no level is served from the results of an earlier one
+            level_results = run_workload(concurrency, f"\n{run_id}-{level}".encode('ascii'))
+            level_elapsed = time.time() - level_start
+            # Only classified images count; rejected (429) and failed requests come back without a prediction
+            received = len([pred for _, pred in level_results if pred is not None])
+            sweep.append((concurrency, received, level_elapsed))
+        print("------ Concurrency sweep ---")
+        print(f"{'concurrency':>12}{'results':>10}{'seconds':>10}{'req/s':>10}")
+        for concurrency, received, level_elapsed in sweep:
+            print(f"{concurrency:>12}{received:>10}{level_elapsed:>10.2f}{received / level_elapsed if level_elapsed > 0 else 0:>10.2f}")
+        print("------ End of Concurrency sweep ---\n")
+        raise SystemExit(0)
+
+    results = run_workload(num_max_workers)
 
     elapsed = time.time() - start_time 
     print("All requests completed.")
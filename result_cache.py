@@ -0,0 +1,56 @@
+# result_cache.py
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire `ttl` seconds after they were stored.
+    Not thread-safe: it is meant to be used from the web tier's event loop.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (expires_at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value for key (marking it recently used), or default if missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores value under key, evicting expired entries and then the least recently used ones."""
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.evict_expired()
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Removes key and returns its value (even if expired), or default if missing."""
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def evict_expired(self):
+        """Drops all expired entries."""
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self.entries.items() if expires_at <= now]:
+            del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
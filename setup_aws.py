@@ -1,6 +1,8 @@
 # setup_aws.py
 
+import argparse
 import boto3
+import json
 import os
 import time
 
@@ -11,11 +13,13 @@ from key import (
 
 from config import (
     AWS_REGION,
-    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
-    EC2_KEY_PAIR_NAME, AMI_ID, WEB_TIER_INSTANCE_TYPE,
+    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME, # Added RESPONSE_SQS_QUEUE_NAME
+    EC2_KEY_PAIR_NAME, AMI_ID, WEB_TIER_INSTANCE_TYPE, APP_TIER_INSTANCE_TYPE,
     KEY_FILE_PATH, REMOTE_APP_DIR, GIT_REPO_URL,
-    WEB_SG_ID
+    WEB_SG_ID, APP_SG_ID, WEB_UVICORN_WORKERS,
+    APP_IMAGE_RECORD_KEY, APP_READY_MARKER_PREFIX, APP_IMAGE_BUILD_TIMEOUT, APP_IMAGE_READY_TIMEOUT
 )
+from app_tier_image import app_user_data, builder_user_data
 
 # Initialize AWS clients
 ec2 = boto3.client(
@@ -38,9 +42,9 @@ sqs = boto3.client(
 )
 
 def create_s3_buckets():
-    """Creates input and output S3 buckets."""
+    """Creates the input, output and control S3 buckets."""
     print("\n--- Creating S3 Buckets ---")
-    buckets = [S3_INPUT_BUCKET, S3_OUTPUT_BUCKET]
+    buckets = [S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET]
     for bucket_name in buckets:
         try:
             # Check if bucket already exists
@@ -241,7 +245,7 @@ cat << 'EOF_CONFIG' > key.py
 {key_content}
 EOF_CONFIG
 
-nohup venv/bin/uvicorn web_tier_app:app --host 0.0.0.0 --port 8000 &> web_tier_app.log &
+nohup venv/bin/uvicorn web_tier_app:app --host 0.0.0.0 --port 8000 --workers {WEB_UVICORN_WORKERS or '$(nproc)'} &> web_tier_app.log &
 echo "Web tier app started."
 echo "==== USER DATA SCRIPT FINISHED ===="
 sleep 2
@@ -308,7 +312,126 @@ sleep 2
         print(f"Failed to launch Web Tier instance: {e}")
         return None
 
+def launch_app_tier_helper(image_id, user_data, instance_name):
+    """Launches an App Tier instance for the bake step and returns its ID."""
+    response = ec2.run_instances(
+        ImageId=image_id,
+        MinCount=1,
+        MaxCount=1,
+        InstanceType=APP_TIER_INSTANCE_TYPE,
+        KeyName=EC2_KEY_PAIR_NAME,
+        SecurityGroupIds=[APP_SG_ID],
+        UserData=user_data,
+        InstanceInitiatedShutdownBehavior='stop',
+        TagSpecifications=[
+            {
+                'ResourceType': 'instance',
+                'Tags': [{'Key': 'Name', 'Value': instance_name}]
+            }
+        ]
+    )
+    return response['Instances'][0]['InstanceId']
+
+def measure_boot_to_ready(image_id):
+    """
+    Launches a test App Tier instance from an image and returns the time (seconds) from launch until its
+    worker loaded the model and wrote its ready marker, or None if it didn't get ready within APP_IMAGE_READY_TIMEOUT.
+    The test instance serves real requests while it runs, like any App Tier instance.
+    """
+    print(f"Measuring boot-to-ready time of {image_id}...")
+    try:
+        with open("key.py", "r") as f_key:
+            key_content = f_key.read()
+    except FileNotFoundError as e:
+        print(f"Error reading key.py: {e}")
+        return None
+
+    test_instance_id = None
+    marker_key = None
+    try:
+        launched_at = time.time()
+        test_instance_id = launch_app_tier_helper(image_id, app_user_data(key_content, baked=True, ready_marker=True), 'app-bake-test')
+        marker_key = f"{APP_READY_MARKER_PREFIX}{test_instance_id}"
+        print(f"Launched test instance {test_instance_id}. Waiting for its worker to get ready...")
+        while time.time() - launched_at < APP_IMAGE_READY_TIMEOUT:
+            try:
+                s3.head_object(Bucket=S3_CONTROL_BUCKET, Key=marker_key)
+                return time.time() - launched_at
+            except s3.exceptions.ClientError:
+                time.sleep(5)
+        print(f"Test instance {test_instance_id} wasn't ready after {APP_IMAGE_READY_TIMEOUT}s.")
+        return None
+    except Exception as e:
+        print(f"Failed to measure boot-to-ready time: {e}")
+        return None
+    finally:
+        if test_instance_id:
+            try:
+                ec2.terminate_instances(InstanceIds=[test_instance_id])
+                s3.delete_object(Bucket=S3_CONTROL_BUCKET, Key=marker_key)
+            except Exception as e:
+                print(f"Failed to clean up test instance {test_instance_id}: {e}. Please terminate it manually.")
+
+def bake_app_ami():
+    """
+    Bakes an App Tier AMI: a builder instance launched from AMI_ID installs the worker code, the venv with
+    torch and the model weights (see app_tier_image.py) and powers off, and is then snapshotted into an AMI.
+    An instance of the new image is launched to measure its boot-to-ready time, and the AMI ID is recorded
+    in S3 (APP_IMAGE_RECORD_KEY), where the web tier picks it up for App Tier launches.
+    Returns the AMI ID, or None on failure.
+    """
+    print("\n--- Baking App Tier AMI ---")
+    builder_id = None
+    try:
+        started_at = time.time()
+        builder_id = launch_app_tier_helper(AMI_ID, builder_user_data(), 'app-bake-builder')
+        print(f"Launched builder instance {builder_id}. Waiting for it to install everything and stop...")
+        waiter = ec2.get_waiter('instance_stopped')
+        waiter.wait(InstanceIds=[builder_id], WaiterConfig={'Delay': 15, 'MaxAttempts': APP_IMAGE_BUILD_TIMEOUT // 15})
+        print(f"Builder finished in {time.time() - started_at:.0f}s. Creating the image...")
+
+        image_name = f"app-tier-image-{time.strftime('%Y%m%d-%H%M%S')}"
+        image_id = ec2.create_image(
+            InstanceId=builder_id,
+            Name=image_name,
+            Description='App Tier worker with its venv, torch and model weights pre-installed',
+            TagSpecifications=[
+                {
+                    'ResourceType': 'image',
+                    'Tags': [{'Key': 'Name', 'Value': image_name}]
+                }
+            ]
+        )['ImageId']
+        waiter = ec2.get_waiter('image_available')
+        waiter.wait(ImageIds=[image_id], WaiterConfig={'Delay': 15, 'MaxAttempts': 120})
+        print(f"AMI {image_id} ({image_name}) is available.")
+    except Exception as e:
+        print(f"Failed to bake App Tier AMI: {e}")
+        return None
+    finally:
+        if builder_id:
+            ec2.terminate_instances(InstanceIds=[builder_id])
+
+    boot_to_ready = measure_boot_to_ready(image_id)
+    if boot_to_ready is None:
+        print(f"AMI {image_id} was not recorded: its test instance never got ready.")
+        return None
+    print(f"Boot-to-ready time of {image_id}: {boot_to_ready:.0f}s")
+
+    try:
+        record = {'ami_id': image_id, 'name': image_name, 'created': time.time(), 'boot_to_ready_seconds': round(boot_to_ready, 1)}
+        s3.put_object(Bucket=S3_CONTROL_BUCKET, Key=APP_IMAGE_RECORD_KEY, Body=json.dumps(record).encode('utf-8'), ContentType='application/json')
+        print(f"Recorded {image_id} in s3://{S3_CONTROL_BUCKET}/{APP_IMAGE_RECORD_KEY}; new App Tier instances will boot from it.")
+        return image_id
+    except Exception as e:
+        print(f"Failed to record AMI {image_id}: {e}")
+        return None
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the AWS resources of the image recognition service')
+    parser.add_argument('--bake_app_ami', action='store_true', help='Bake a pre-installed App Tier AMI (and record it for App Tier launches) instead of launching the Web Tier')
+    args = parser.parse_args()
+
     # Create dummy files if they don't exist, so 'open' calls in launch_web_tier_instance don't fail initially
     # These will be overwritten or contain actual content later.
     # Ensure config.py exists as it's modified by the user
@@ -316,6 +439,13 @@ if __name__ == "__main__":
         print("Error: config.py not found. Please create it with your AWS details.")
         exit(1)
 
+    if args.bake_app_ami:
+        if not bake_app_ami():
+            print("Failed to bake the App Tier AMI. Exiting.")
+            exit(1)
+        print("\n--- App Tier AMI Baked ---")
+        exit(0)
+
 
     # if not create_s3_buckets():
     #     print("Failed to set up S3 buckets. Exiting.")
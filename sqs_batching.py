@@ -0,0 +1,194 @@
+# sqs_batching.py
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+# SQS accepts at most 10 entries per batch request
+SQS_MAX_BATCH_ENTRIES = 10
+# ... and at most 256 KB of message bodies per send_message_batch request
+SQS_MAX_BATCH_BYTES = 256 * 1024
+
+
+def entry_size(entry):
+    """Returns the number of bytes an entry counts against the batch size limit (its message body)."""
+    body = entry.get('MessageBody')
+    return len(body.encode('utf-8')) if body is not None else 0
+
+
+class SqsBatchEntryError(Exception):
+    """Raised (through an entry's future) when SQS rejects a batch entry for good."""
+
+    def __init__(self, code, message, sender_fault):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.sender_fault = sender_fault
+
+
+class SqsBatcher:
+    """
+    Accumulates SQS entries for one queue and flushes them with a single batch call
+    (send_message_batch, delete_message_batch or change_message_visibility_batch) as soon as
+    10 entries (or 256 KB of message bodies) are pending or the oldest pending entry has
+    waited max_delay seconds. flush_threads batches can be in flight at once.
+
+    submit() returns a concurrent.futures.Future resolved with the entry's result
+    (the "Successful" item SQS returned) once the entry is acknowledged. Cancelling the future
+    before its batch is sent drops the entry. Entries that fail
+    because of a server-side error, or because the whole call failed, are retried up to
+    max_retries times; entries SQS rejects as the sender's fault fail immediately with
+    SqsBatchEntryError.
+    """
+
+    OPERATIONS = {
+        'send': 'send_message_batch',
+        'delete': 'delete_message_batch',
+        'change_visibility': 'change_message_visibility_batch',
+    }
+
+    def __init__(self, sqs_client, queue_url, operation, max_delay=0.05, max_retries=2, flush_threads=1):
+        if operation not in self.OPERATIONS:
+            raise ValueError(f"Unknown SQS batch operation '{operation}'.")
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.operation = operation
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.condition = threading.Condition()
+        self.pending = [] # (submitted_at, entry, future, attempts), oldest first
+        self.pending_bytes = 0
+        self.closed = False
+        self.entry_ids = itertools.count()
+        # Counters for monitoring how much batching saves
+        self.entries_sent = 0
+        self.api_calls = 0
+        self.failed_entries = 0
+        self.threads = [threading.Thread(target=self.flush_loop, name=f"sqs-{operation}-batcher-{i}", daemon=True) for i in range(flush_threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, entry):
+        """
+        Queues an entry (the batch entry dict without its 'Id', e.g. {'MessageBody': ...}
+        or {'ReceiptHandle': ...}) and returns a Future for its acknowledgement.
+        """
+        future = Future()
+        with self.condition:
+            self.pending.append((time.time(), entry, future, 0))
+            self.pending_bytes += entry_size(entry)
+            # Wake the flusher when a batch fills up or when it is idle waiting for a first entry
+            if len(self.pending) >= SQS_MAX_BATCH_ENTRIES or self.pending_bytes >= SQS_MAX_BATCH_BYTES or len(self.pending) == 1:
+                self.condition.notify_all()
+        return future
+
+    def close(self):
+        """Stops the flush threads once the pending entries are flushed. No entries may be submitted afterwards."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def batch_length(self):
+        """Returns how many of the oldest pending entries fit in one batch request (at least 1)."""
+        length, size = 0, 0
+        for _, entry, _, _ in self.pending[:SQS_MAX_BATCH_ENTRIES]:
+            size += entry_size(entry)
+            if length and size > SQS_MAX_BATCH_BYTES:
+                break
+            length += 1
+        return length
+
+    def take_batch(self):
+        """
+        Blocks until a batch is due, then removes and returns the pending entries that fit in one batch request
+        (None once the batcher is closed and drained).
+        Entries whose future was cancelled (e.g., the caller stopped waiting) are dropped; the others can't be cancelled anymore.
+        """
+        with self.condition:
+            while True:
+                if not self.pending:
+                    if self.closed:
+                        return None
+                    self.condition.wait()
+                    continue
+                length = self.batch_length()
+                # Full (by count or size) batches go out right away
+                if length >= SQS_MAX_BATCH_ENTRIES or length < len(self.pending):
+                    break
+                wait_time = self.pending[0][0] + self.max_delay - time.time()
+                if wait_time <= 0 or self.closed:
+                    break
+                self.condition.wait(wait_time)
+            batch = self.pending[:length]
+            del self.pending[:length]
+            self.pending_bytes -= sum(entry_size(item[1]) for item in batch)
+        # Retried entries (attempts > 0) were already marked running when first taken
+        return [item for item in batch if item[3] > 0 or item[2].set_running_or_notify_cancel()]
+
+    def retry_or_fail(self, item, error):
+        """Puts an entry back in the queue, or fails its future once it is out of retries."""
+        _, entry, future, attempts = item
+        if attempts < self.max_retries:
+            # Re-queued entries wait another max_delay, which also spaces out retries
+            with self.condition:
+                self.pending.append((time.time(), entry, future, attempts + 1))
+                self.pending_bytes += entry_size(entry)
+                self.condition.notify_all()
+        else:
+            self.failed_entries += 1
+            future.set_exception(error)
+
+    def flush(self, batch):
+        """Sends one batch request and resolves, retries or fails each entry's future."""
+        entries_by_id = {}
+        request_entries = []
+        for item in batch:
+            entry_id = str(next(self.entry_ids))
+            entries_by_id[entry_id] = item
+            request_entries.append(dict(item[1], Id=entry_id))
+
+        try:
+            self.api_calls += 1
+            response = getattr(self.sqs, self.OPERATIONS[self.operation])(QueueUrl=self.queue_url, Entries=request_entries)
+        except Exception as e:
+            logging.error(f"SQS {self.operation} batch of {len(batch)} entries failed: {e}")
+            for item in batch:
+                self.retry_or_fail(item, e)
+            return
+
+        for result in response.get('Successful', []):
+            item = entries_by_id.pop(result['Id'], None)
+            if item is not None:
+                self.entries_sent += 1
+                item[2].set_result(result)
+        for failure in response.get('Failed', []):
+            item = entries_by_id.pop(failure['Id'], None)
+            if item is None:
+                continue
+            error = SqsBatchEntryError(failure.get('Code'), failure.get('Message'), failure.get('SenderFault', False))
+            logging.warning(f"SQS {self.operation} entry failed: {error} (sender fault: {error.sender_fault})")
+            if error.sender_fault:
+                self.failed_entries += 1
+                item[2].set_exception(error)
+            else:
+                self.retry_or_fail(item, error)
+        # Entries SQS didn't report on at all are retried as well
+        for item in entries_by_id.values():
+            self.retry_or_fail(item, SqsBatchEntryError('MissingResult', 'No result returned for entry', False))
+
+    def flush_loop(self):
+        """Background thread flushing due batches."""
+        while True:
+            batch = self.take_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logging.error(f"Unexpected error flushing SQS {self.operation} batch: {e}")
+                for item in batch:
+                    if not item[2].done():
+                        item[2].set_exception(e)
@@ -0,0 +1,71 @@
+# test_sqs_batching.py
+
+import threading
+import unittest
+from concurrent.futures import CancelledError
+
+from sqs_batching import SqsBatcher
+
+
+class FakeSqs:
+    """Stands in for the boto3 SQS client: accepts every entry, and can hold calls until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.release.wait()
+        self.calls.append(Entries)
+        return {'Successful': [{'Id': entry['Id'], 'MessageId': f"message-{entry['Id']}"} for entry in Entries]}
+
+
+class SqsBatcherCancellationTest(unittest.TestCase):
+
+    def test_cancelled_entry_is_dropped_and_others_succeed(self):
+        sqs = FakeSqs()
+        batcher = SqsBatcher(sqs, 'queue-url', 'send', max_delay=0.2)
+        futures = [batcher.submit({'MessageBody': f"body-{i}"}) for i in range(3)]
+        self.assertTrue(futures[0].cancel())
+
+        self.assertIn('MessageId', futures[1].result(timeout=5))
+        self.assertIn('MessageId', futures[2].result(timeout=5))
+        with self.assertRaises(CancelledError):
+            futures[0].result(timeout=5)
+        self.assertEqual(len(sqs.calls), 1)
+        self.assertEqual([entry['MessageBody'] for entry in sqs.calls[0]], ['body-1', 'body-2'])
+
+    def test_entry_in_flight_can_no_longer_be_cancelled(self):
+        sqs = FakeSqs()
+        sqs.release.clear()
+        batcher = SqsBatcher(sqs, 'queue-url', 'send', max_delay=0)
+        future = batcher.submit({'MessageBody': 'body'})
+        # Wait until the flush thread has taken the entry
+        for _ in range(500):
+            if not batcher.pending and future.running():
+                break
+            threading.Event().wait(0.01)
+        self.assertFalse(future.cancel())
+
+        sqs.release.set()
+        self.assertIn('MessageId', future.result(timeout=5))
+        self.assertEqual(batcher.failed_entries, 0)
+
+
+class SqsBatcherCloseTest(unittest.TestCase):
+
+    def test_close_flushes_pending_entries_and_stops_threads(self):
+        sqs = FakeSqs()
+        batcher = SqsBatcher(sqs, 'queue-url', 'send', max_delay=60, flush_threads=2)
+        future = batcher.submit({'MessageBody': 'body'})
+        batcher.close()
+
+        self.assertIn('MessageId', future.result(timeout=5))
+        for thread in batcher.threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
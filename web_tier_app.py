@@ -1,27 +1,54 @@
 # web_tier_app.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List
 import boto3
+import fcntl
+from botocore.config import Config
 import uuid
 import os
+import hashlib
+import json
 import asyncio
+import functools
 import logging
+import math
 import threading
 import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from key import (
     AWS_ACCESS_KEY_ID,
     AWS_SECRET_ACCESS_KEY
 )
 
+from result_cache import TTLCache
+from sqs_batching import SqsBatcher
+from message_protocol import encode_request, fits_in_message
+from cancellation import CancellationPublisher, cancellation_key
+from autoscaling import create_policy, RateTracker, BootLatencyEstimator
+from app_tier_image import app_user_data
+
 from config import (
     AWS_REGION,
-    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME,
+    S3_INPUT_BUCKET, S3_OUTPUT_BUCKET, S3_CONTROL_BUCKET, SQS_QUEUE_NAME, RESPONSE_SQS_QUEUE_NAME,
     EC2_KEY_PAIR_NAME, AMI_ID, APP_TIER_INSTANCE_TYPE,
     MAX_APP_INSTANCES, MIN_APP_INSTANCES,
-    SCALING_CHECK_INTERVAL, WEB_TIER_POLLING_INTERVAL,
-    REMOTE_APP_DIR, GIT_REPO_URL, APP_SG_ID
+    SCALING_CHECK_INTERVAL, AUTOSCALING_POLICY, SLO_LATENCY_WINDOW,
+    WARM_POOL_SIZE, APP_INSTANCE_NAME_PREFIX, WARM_POOL_NAME_PREFIX,
+    APP_SG_ID, APP_IMAGE_RECORD_KEY,
+    WEB_RESULT_CACHE_SIZE, WEB_RESULT_CACHE_TTL,
+    WEB_AWS_IO_THREADS, WEB_INLINE_IMAGE_MAX_BYTES,
+    WEB_REQUEST_TIMEOUT, WEB_MAX_IN_FLIGHT, WEB_MAX_RETRY_AFTER, WEB_SERVICE_RATE_WINDOW, WEB_JANITOR_INTERVAL,
+    WEB_DISCONNECT_CHECK_INTERVAL, WEB_CANCELLATION_PUBLISH_INTERVAL,
+    WEB_MAX_BATCH_FILES, WEB_ENQUEUE_BATCH_WINDOW, WEB_ENQUEUE_FLUSH_THREADS,
+    WEB_PER_NODE_RESPONSE_QUEUES, WEB_NODE_QUEUE_PREFIX, WEB_RUN_AUTOSCALER, WEB_AUTOSCALER_LOCK_PATH,
+    WEB_STATS_PREFIX, WEB_STATS_MAX_AGE,
+    WEB_JOB_TIMEOUT, WEB_MAX_PENDING_JOBS, WEB_JOB_STORE_SIZE, WEB_JOB_TTL, WEB_JOB_MAX_WAIT, WEB_SSE_KEEPALIVE_INTERVAL,
+    WEB_RESPONSE_POLLERS, WEB_RESPONSE_WAIT_TIME, WEB_RESPONSE_DELETE_MAX_DELAY, WEB_RESPONSE_LAG_WINDOW
 )
 
 app = FastAPI()
@@ -30,39 +57,97 @@ app = FastAPI()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Initialize AWS clients
+# Connection pools are sized to the AWS I/O thread pool, the response long-pollers and the
+# batchers' flush threads so concurrent calls don't queue for a connection
+aws_client_config = Config(max_pool_connections=WEB_AWS_IO_THREADS + WEB_RESPONSE_POLLERS + WEB_ENQUEUE_FLUSH_THREADS + 1)
 s3 = boto3.client(
     's3',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=aws_client_config
 )
 sqs = boto3.client(
     'sqs',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=aws_client_config
 )
 ec2 = boto3.client(
     'ec2',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=aws_client_config
 )
 
+# Identity of this web process. Every process publishes its own cancelled set and, with WEB_PER_NODE_RESPONSE_QUEUES,
+# gets its own response queue, so any number of web processes/instances can share the App Tier.
+NODE_ID = uuid.uuid4().hex[:12]
+node_response_queue_url = None # This process's own response queue (created on startup)
+autoscaler_lock_file = None # Held by the one process per instance that runs the auto-scaling controller
+
+# boto3 calls block, so they run on this bounded thread pool instead of the event loop
+aws_executor = ThreadPoolExecutor(max_workers=WEB_AWS_IO_THREADS, thread_name_prefix='aws-io')
+
 # Global variables for auto-scaling
 app_tier_sg_id = None # Will be retrieved on startup
 app_instance_count_lock = threading.Lock() # Lock for managing instance count
 running_app_instances = set() # Store instance IDs of running app tier instances
+scaling_policy = create_policy(AUTOSCALING_POLICY) # Decides how many app instances to run
+arrival_tracker = RateTracker() # Requests sent to the App Tier by this process
+boot_latency = BootLatencyEstimator() # Time from launching an app instance to its first response
 
 # Dictionary to hold futures for pending requests
 # Key: unique_request_id (derived from output_s3_key_base + UUID)
 # Value: asyncio.Future object
 pending_requests = {}
+# Deadline (epoch seconds) of every request in pending_requests, for the janitor
+pending_deadlines = {}
+# Time (epoch seconds) every request in pending_requests was registered, for latency tracking
+pending_started_at = {}
+
+# Admission control state
+in_flight_uploads = 0 # Uploads currently being processed
+latest_request_queue_depth = 0 # Request queue depth last seen by the auto-scaling controller
+admission_stats = {'rejected': 0, 'timed_out': 0, 'expired': 0, 'disconnected': 0, 'cancelled': 0}
+
+# Results of recently classified images, keyed by the SHA-256 of the image bytes
+result_cache = TTLCache(WEB_RESULT_CACHE_SIZE, WEB_RESULT_CACHE_TTL)
+# Futures of requests currently in flight, keyed by the SHA-256 of the image bytes,
+# so concurrent uploads of identical images share one classification
+in_flight_by_hash = {}
+# Number of uploads waiting on each in-flight request, and the request's ID, keyed like in_flight_by_hash
+in_flight_waiters = {}
+in_flight_request_ids = {}
+
+# Recently cancelled requests, published to the App Tier (see cancellation.py)
+# (kept as long as the longest deadline; after that workers drop the request by its deadline anyway).
+# The set is this node's own, so processes don't overwrite each other's; requests name the node (see request_routing)
+cancellation_publisher = CancellationPublisher(
+    s3, S3_CONTROL_BUCKET,
+    ttl=max(WEB_REQUEST_TIMEOUT, WEB_JOB_TIMEOUT),
+    key=cancellation_key(NODE_ID)
+)
+
+# Jobs submitted through the job API: those still waiting for a result, by job ID,
+# and finished ones, kept for WEB_JOB_TTL seconds
+running_jobs = {}
+job_store = TTLCache(WEB_JOB_STORE_SIZE, WEB_JOB_TTL)
 
 # SQS Queue URLs
 request_queue_url = None
 response_queue_url = None
 
+# Enqueue coalescer: batches outgoing request messages into send_message_batch calls (created on startup)
+request_batcher = None
+
+
+async def run_aws(func, *args, **kwargs):
+    """Runs a blocking AWS (boto3) call on the AWS I/O thread pool and awaits its result."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(aws_executor, functools.partial(func, *args, **kwargs))
 
 def get_queue_url(queue_name):
     """Retrieves the SQS queue URL for a given queue name."""
@@ -73,6 +158,95 @@ def get_queue_url(queue_name):
         logging.error(f"Failed to get SQS queue URL for {queue_name}: {e}")
         return None
 
+def create_node_response_queue():
+    """Creates this web process's own response queue and returns its URL, or None on failure."""
+    queue_name = f"{WEB_NODE_QUEUE_PREFIX}{NODE_ID}"
+    try:
+        response = sqs.create_queue(
+            QueueName=queue_name,
+            # Responses are useless once the request's deadline passed; don't keep them around for days
+            Attributes={'MessageRetentionPeriod': '3600'}
+        )
+        logging.info(f"Created response queue '{queue_name}' for web node {NODE_ID} (host {os.uname().nodename}, PID {os.getpid()}).")
+        return response['QueueUrl']
+    except Exception as e:
+        logging.error(f"Error creating response queue '{queue_name}': {e}")
+        return None
+
+def delete_node_response_queue(queue_url):
+    """Deletes this web process's response queue."""
+    try:
+        sqs.delete_queue(QueueUrl=queue_url)
+        logging.info(f"Deleted response queue of web node {NODE_ID}.")
+    except Exception as e:
+        logging.error(f"Error deleting response queue {queue_url}: {e}")
+
+def acquire_autoscaler_lock():
+    """
+    Makes this process the instance's auto-scaling controller unless another uvicorn worker already is.
+    The file lock is released by the OS when the holder exits, so another worker takes over.
+    Returns True if this process holds the lock.
+    """
+    global autoscaler_lock_file
+    if autoscaler_lock_file is not None:
+        return True
+    lock_file = open(WEB_AUTOSCALER_LOCK_PATH, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    autoscaler_lock_file = lock_file
+    logging.info(f"Web node {NODE_ID} (PID {os.getpid()}) is running the auto-scaling controller.")
+    return True
+
+def publish_web_stats():
+    """
+    Publishes this process's arrival and service rates, and the App Tier instances it received
+    responses from since the previous publish, to the control bucket (see WEB_STATS_PREFIX).
+    """
+    stats = {
+        'updated_at': time.time(),
+        'arrival_rate': arrival_tracker.rate(SCALING_CHECK_INTERVAL),
+        'service_rate': response_dispatcher.service_rate(),
+        'first_responses': response_dispatcher.take_first_responses(),
+    }
+    try:
+        s3.put_object(Bucket=S3_CONTROL_BUCKET, Key=f"{WEB_STATS_PREFIX}{NODE_ID}", Body=json.dumps(stats).encode('utf-8'), ContentType='application/json')
+    except Exception as e:
+        logging.warning(f"Failed to publish the stats of web node {NODE_ID}: {e}")
+
+def read_web_stats():
+    """
+    Sums the arrival and service rates published by all live web processes (see publish_web_stats) and
+    merges their first responses per App Tier instance (earliest wins).
+    Returns (arrival_rate, service_rate, first_responses), or None if the stats can't be read.
+    """
+    arrival_rate, service_rate, first_responses = 0.0, 0.0, {}
+    try:
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=S3_CONTROL_BUCKET, Prefix=WEB_STATS_PREFIX):
+            for obj in page.get('Contents', []):
+                response = s3.get_object(Bucket=S3_CONTROL_BUCKET, Key=obj['Key'])
+                stats = json.loads(response['Body'].read().decode('utf-8'))
+                if time.time() - stats['updated_at'] > WEB_STATS_MAX_AGE:
+                    continue
+                arrival_rate += stats['arrival_rate']
+                service_rate += stats['service_rate']
+                for instance_id, responded_at in stats['first_responses'].items():
+                    first_responses[instance_id] = min(responded_at, first_responses.get(instance_id, responded_at))
+    except Exception as e:
+        logging.warning(f"Failed to read the web tier's stats: {e}")
+        return None
+    return arrival_rate, service_rate, first_responses
+
+def delete_web_stats():
+    """Removes this process's published stats (on shutdown)."""
+    try:
+        s3.delete_object(Bucket=S3_CONTROL_BUCKET, Key=f"{WEB_STATS_PREFIX}{NODE_ID}")
+    except Exception as e:
+        logging.warning(f"Failed to delete the stats of web node {NODE_ID}: {e}")
+
 def get_app_tier_security_group_id():
     """Retrieves the Security Group ID for App Tier."""
     global app_tier_sg_id
@@ -130,7 +304,7 @@ def get_running_app_instances():
         response = ec2.describe_instances(
             Filters=[
                 {'Name': 'instance-state-name', 'Values': ['pending', 'running']},
-                {'Name': 'tag:Name', 'Values': ['app-instance-*']} # Match instances named app-instance-X
+                {'Name': 'tag:Name', 'Values': [f'{APP_INSTANCE_NAME_PREFIX}*']} # Match instances named app-instance-X
             ]
         )
         instances = []
@@ -142,53 +316,48 @@ def get_running_app_instances():
         logging.error(f"Failed to describe App Tier instances: {e}")
         return []
 
-def launch_app_instance(instance_name_tag):
-    """Launches a new App Tier EC2 instance."""
+def get_app_image_id():
+    """
+    Returns the AMI App Tier instances are launched from: the image recorded by the bake step of
+    setup_aws.py (see APP_IMAGE_RECORD_KEY), or the stock AMI_ID if none has been baked.
+    """
+    try:
+        response = s3.get_object(Bucket=S3_CONTROL_BUCKET, Key=APP_IMAGE_RECORD_KEY)
+        return json.loads(response['Body'].read())['ami_id']
+    except s3.exceptions.NoSuchKey:
+        return AMI_ID
+    except Exception as e:
+        logging.error(f"Failed to read the baked App Tier image record: {e}. Using the stock AMI.")
+        return AMI_ID
 
-    # This user data script will install necessary packages, clone the classifier repo,
-    # and start the app_tier_worker.
+def build_app_user_data(image_id, warm_pool=False):
+    """
+    Returns the user data script of an App Tier instance launched from image_id (see app_tier_image.py):
+    on the stock AMI it installs everything first, on a baked image it only writes key.py and starts the worker.
+    Warm pool instances (warm_pool=True) power off once initialised instead of starting the worker.
+    Returns None if the user data can't be prepared.
+    """
     try:
         with open("key.py", "r") as f_key:
             key_content = f_key.read()
-
-        user_data_app_script = f"""#!/bin/bash
-sudo -i
-cd /home/ubuntu
-apt update -y
-apt install python3 -y
-apt install python3-pip -y
-apt install python3-venv -y
-apt install git -y
-
-mkdir -p {REMOTE_APP_DIR}
-cd {REMOTE_APP_DIR}
-git clone {GIT_REPO_URL} .
-
-python3 -m venv venv
-source venv/bin/activate
-pip install --upgrade pip
-pip install boto3
-pip install --break-system-packages torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cpu
-
-cat << 'EOF_CONFIG' > key.py
-{key_content}
-EOF_CONFIG
-
-# Start the App Tier Worker in the background
-nohup python3 app_tier_worker.py &> app_tier_worker.log &
-echo "App tier worker started."
-"""
-
     except FileNotFoundError as e:
         logging.error(f"Error reading file for user_data_app_script: {e}. Make sure key.py exists.")
         return None
     except Exception as e:
         logging.error(f"Error preparing user data for app tier: {e}")
         return None
+    return app_user_data(key_content, baked=image_id != AMI_ID, warm_pool=warm_pool)
+
+def launch_app_instance(instance_name_tag):
+    """Launches a new App Tier EC2 instance."""
+    image_id = get_app_image_id()
+    user_data_app_script = build_app_user_data(image_id)
+    if user_data_app_script is None:
+        return None
 
     try:
         response = ec2.run_instances(
-            ImageId=AMI_ID,
+            ImageId=image_id,
             MinCount=1,
             MaxCount=1,
             InstanceType=APP_TIER_INSTANCE_TYPE,
@@ -204,6 +373,7 @@ echo "App tier worker started."
         )
         instance_id = response['Instances'][0]['InstanceId']
         logging.info(f"Launched App Tier instance: {instance_id} with name {instance_name_tag}")
+        boot_latency.launched(instance_id)
         with app_instance_count_lock:
             running_app_instances.add(instance_id)
         return instance_id
@@ -222,179 +392,565 @@ def terminate_app_instance(instance_id):
     except Exception as e:
         logging.error(f"Failed to terminate App Tier instance {instance_id}: {e}")
 
+def get_warm_pool_instances():
+    """
+    Returns the warm pool's instances (named app-pool-N) as a dict of instance ID -> state.
+    'stopped' instances are ready to start; 'pending'/'running' ones are still initialising and 'stopping' ones about to be ready.
+    Returns None if the pool can't be described.
+    """
+    try:
+        response = ec2.describe_instances(
+            Filters=[
+                {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+                {'Name': 'tag:Name', 'Values': [f'{WARM_POOL_NAME_PREFIX}*']}
+            ]
+        )
+        instances = {}
+        for reservation in response['Reservations']:
+            for instance in reservation['Instances']:
+                instances[instance['InstanceId']] = instance['State']['Name']
+        return instances
+    except Exception as e:
+        logging.error(f"Failed to describe warm pool instances: {e}")
+        return None
+
+def launch_warm_pool_instance(instance_name_tag):
+    """Launches a new warm pool instance, which initialises itself and then stops (see build_app_user_data)."""
+    image_id = get_app_image_id()
+    user_data_app_script = build_app_user_data(image_id, warm_pool=True)
+    if user_data_app_script is None:
+        return None
+    try:
+        response = ec2.run_instances(
+            ImageId=image_id,
+            MinCount=1,
+            MaxCount=1,
+            InstanceType=APP_TIER_INSTANCE_TYPE,
+            KeyName=EC2_KEY_PAIR_NAME,
+            SecurityGroupIds=[APP_SG_ID],
+            UserData=user_data_app_script,
+            InstanceInitiatedShutdownBehavior='stop',
+            TagSpecifications=[
+                {
+                    'ResourceType': 'instance',
+                    'Tags': [{'Key': 'Name', 'Value': instance_name_tag}]
+                }
+            ]
+        )
+        instance_id = response['Instances'][0]['InstanceId']
+        logging.info(f"Launched warm pool instance: {instance_id} with name {instance_name_tag}")
+        return instance_id
+    except Exception as e:
+        logging.error(f"Failed to launch warm pool instance {instance_name_tag}: {e}")
+        return None
+
+def get_instance_name(instance_id):
+    """Returns the Name tag of an EC2 instance, or None if it has none."""
+    response = ec2.describe_instances(InstanceIds=[instance_id])
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            for tag in instance.get('Tags', []):
+                if tag['Key'] == 'Name':
+                    return tag['Value']
+    return None
+
+def restore_instance_name(instance_id, name_tag):
+    """Renames an instance back to name_tag after a failed warm pool transition."""
+    try:
+        ec2.create_tags(Resources=[instance_id], Tags=[{'Key': 'Name', 'Value': name_tag}])
+        logging.info(f"Renamed instance {instance_id} back to {name_tag}")
+    except Exception as e:
+        logging.error(f"Failed to rename instance {instance_id} back to {name_tag}: {e}. Please check it manually.")
+
+def start_pool_instance(instance_id, instance_name_tag):
+    """
+    Takes a stopped instance out of the warm pool: renames it to instance_name_tag and starts it. Returns True on success.
+    If the start fails, the instance gets its pool name back, so it stays in the pool instead of being
+    left stopped under an App Tier name.
+    """
+    pool_name_tag = None
+    try:
+        pool_name_tag = get_instance_name(instance_id)
+        ec2.create_tags(Resources=[instance_id], Tags=[{'Key': 'Name', 'Value': instance_name_tag}])
+        ec2.start_instances(InstanceIds=[instance_id])
+        logging.info(f"Started warm pool instance {instance_id} as {instance_name_tag}")
+        boot_latency.launched(instance_id)
+        with app_instance_count_lock:
+            running_app_instances.add(instance_id)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to start warm pool instance {instance_id}: {e}")
+        if pool_name_tag:
+            restore_instance_name(instance_id, pool_name_tag)
+        return False
+
+def stop_app_instance_into_pool(instance_id, pool_name_tag):
+    """
+    Stops an App Tier instance and returns it to the warm pool under pool_name_tag. Returns True on success.
+    The instance is renamed before it is stopped; if the stop fails it gets its App Tier name back, so it is
+    never left running under a pool name (where the autoscaler wouldn't count it).
+    """
+    instance_name_tag = None
+    try:
+        instance_name_tag = get_instance_name(instance_id)
+        ec2.create_tags(Resources=[instance_id], Tags=[{'Key': 'Name', 'Value': pool_name_tag}])
+        ec2.stop_instances(InstanceIds=[instance_id])
+        logging.info(f"Stopping App Tier instance {instance_id} into the warm pool as {pool_name_tag}")
+        with app_instance_count_lock:
+            running_app_instances.discard(instance_id)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to stop App Tier instance {instance_id} into the warm pool: {e}")
+        if instance_name_tag:
+            restore_instance_name(instance_id, instance_name_tag)
+        return False
+
+def free_instance_name(prefix, used_numbers, limit):
+    """Returns the name prefix + N with the smallest N in 1..limit not in used_numbers (and marks it used), or None."""
+    for num in range(1, limit + 1):
+        if num not in used_numbers:
+            used_numbers.add(num)
+            return f"{prefix}{num}"
+    return None
+
+async def replenish_warm_pool():
+    """Launches warm pool instances until the pool (ready and initialising) holds WARM_POOL_SIZE instances."""
+    if WARM_POOL_SIZE <= 0:
+        return
+    pool_instances = await run_aws(get_warm_pool_instances)
+    if pool_instances is None:
+        return
+    missing = WARM_POOL_SIZE - len(pool_instances)
+    if missing <= 0:
+        return
+    used_numbers = await run_aws(get_used_app_instance_numbers, WARM_POOL_NAME_PREFIX)
+    for _ in range(missing):
+        instance_name = free_instance_name(WARM_POOL_NAME_PREFIX, used_numbers, WARM_POOL_SIZE + MAX_APP_INSTANCES)
+        if instance_name is None:
+            break
+        logging.info(f"Replenishing the warm pool: launching {instance_name}...")
+        await run_aws(launch_warm_pool_instance, instance_name)
+        await asyncio.sleep(2)
+
+def get_used_app_instance_numbers(prefix=APP_INSTANCE_NAME_PREFIX):
+    """Returns the N of every instance named <prefix>N that isn't shutting down or terminated (app-instance-N by default)."""
+    used_numbers = set()
+    try:
+        response = ec2.describe_instances(
+            Filters=[
+                {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+                {'Name': 'tag:Name', 'Values': [f'{prefix}*']}
+            ]
+        )
+        for reservation in response['Reservations']:
+            for instance in reservation['Instances']:
+                for tag in instance.get('Tags', []):
+                    if tag['Key'] == 'Name' and tag['Value'].startswith(prefix):
+                        try:
+                            num = int(tag['Value'].split('-')[-1])
+                            used_numbers.add(num)
+                        except Exception:
+                            continue
+    except Exception as e:
+        logging.error(f"Error retrieving existing {prefix}N names: {e}")
+    return used_numbers
+
 async def auto_scaling_controller():
     """
     Monitors SQS queue depth and adjusts App Tier EC2 instances.
-    Scaling policy:
-    - If queue depth > 10, scale out to 10 app instances (max).
-    - If queue depth <= 10, gradually scale in to 0.
-    - Never exceed 19 running app instances.
+    The number of instances to run is decided by the AUTOSCALING_POLICY policy (see autoscaling.py)
+    and is always within [MIN_APP_INSTANCES, MAX_APP_INSTANCES].
+    Scale-out starts stopped warm pool instances before launching new ones, scale-in stops instances
+    back into the pool while it holds fewer than WARM_POOL_SIZE, and the pool is refilled after each step.
     """
-    logging.info("Auto-scaling controller started.")
+    global latest_request_queue_depth
+    logging.info(f"Auto-scaling controller started with the '{scaling_policy.name}' policy.")
     MAX_INSTANCES = MAX_APP_INSTANCES
     MIN_INSTANCES = MIN_APP_INSTANCES
     while True:
         try:
-            queue_messages = get_approximate_number_of_messages()
-            response_queue_messages = get_approximate_number_of_response_messages()
-            current_running_instances = get_running_app_instances()
+            queue_messages = await run_aws(get_approximate_number_of_messages)
+            latest_request_queue_depth = queue_messages
+            # Every process tracks the queue depth (for Retry-After) and publishes its stats; only one per deployment scales
+            await run_aws(publish_web_stats)
+            if not WEB_RUN_AUTOSCALER or not acquire_autoscaler_lock():
+                continue
+            response_queue_messages = await run_aws(get_approximate_number_of_response_messages)
+            current_running_instances = await run_aws(get_running_app_instances)
             # Update the set of running instances to remove terminated ones
             with app_instance_count_lock:
                 running_app_instances.intersection_update(current_running_instances)
             current_instance_count = len(running_app_instances)
+            boot_latency.retain(set(current_running_instances))
 
-            logging.info(f"Request SQS: {queue_messages}, Response SQS: {response_queue_messages}, Current App instances: {current_instance_count}")
+            # Rates and first responses of every web process (responses are spread over all of them);
+            # this process's own values if the published stats can't be read
+            web_stats = await run_aws(read_web_stats)
+            if web_stats is None:
+                web_stats = (arrival_tracker.rate(SCALING_CHECK_INTERVAL), response_dispatcher.service_rate(), {})
+            arrival_rate, service_rate, first_responses = web_stats
+            for instance_id, responded_at in first_responses.items():
+                boot_latency.responded(instance_id, now=responded_at)
 
             # Decide target number of app instances
-            if queue_messages > 10:
-                target_instances = MAX_INSTANCES
-            else:
-                target_instances = MIN_INSTANCES
+            now = time.time()
+            target_instances = scaling_policy.decide({
+                'queue_depth': queue_messages,
+                'instances': current_instance_count,
+                'now': now,
+                'arrival_rate': arrival_rate,
+                'service_rate': service_rate,
+                'ready_instances': max(0, current_instance_count - boot_latency.booting()),
+                'boot_latency': boot_latency.latency,
+                'latency_p95': response_dispatcher.latency_percentile(0.95),
+                'latency_p05': response_dispatcher.latency_percentile(0.05),
+            })
+            target_instances = max(MIN_INSTANCES, min(MAX_INSTANCES, target_instances))
+
+            logging.info(f"Request SQS: {queue_messages}, Response SQS: {response_queue_messages}, Current App instances: {current_instance_count}, Target: {target_instances}")
 
-            # Scale out: launch new instances up to target (max 19)
+            # Scale out: start warm pool instances, then launch new instances, up to target
             if current_instance_count < target_instances:
                 instances_to_launch = min(target_instances - current_instance_count, MAX_INSTANCES - current_instance_count)
-                used_numbers = set()
-                try:
-                    response = ec2.describe_instances(
-                        Filters=[
-                            {'Name': 'instance-state-name', 'Values': ['pending', 'running']},
-                            {'Name': 'tag:Name', 'Values': [f'app-instance-*']}
-                        ]
-                    )
-                    for reservation in response['Reservations']:
-                        for instance in reservation['Instances']:
-                            for tag in instance.get('Tags', []):
-                                if tag['Key'] == 'Name' and tag['Value'].startswith('app-instance-'):
-                                    try:
-                                        num = int(tag['Value'].split('-')[-1])
-                                        used_numbers.add(num)
-                                    except Exception:
-                                        continue
-                except Exception as e:
-                    logging.error(f"Error retrieving existing app-instance names: {e}")
+                used_numbers = await run_aws(get_used_app_instance_numbers)
+                pool_instances = await run_aws(get_warm_pool_instances) if WARM_POOL_SIZE > 0 else None
+                ready_pool_ids = [instance_id for instance_id, state in (pool_instances or {}).items() if state == 'stopped']
 
                 for _ in range(instances_to_launch):
-                    # Find the smallest unused number in 1..MAX_INSTANCES
-                    for num in range(1, MAX_INSTANCES + 1):
-                        if num not in used_numbers:
-                            instance_name = f"app-instance-{num}"
-                            used_numbers.add(num)
-                            logging.info(f"Scaling out: Launching new App Tier instance ({instance_name})...")
-                            launch_app_instance(instance_name)
-                            await asyncio.sleep(2)
-                            break
-                    else:
+                    # Use the smallest unused number in 1..MAX_INSTANCES
+                    instance_name = free_instance_name(APP_INSTANCE_NAME_PREFIX, used_numbers, MAX_INSTANCES)
+                    if instance_name is None:
                         logging.info("Reached MAX_INSTANCES limit. Not launching more.")
                         break
+                    if ready_pool_ids and await run_aws(start_pool_instance, ready_pool_ids.pop(), instance_name):
+                        logging.info(f"Scaling out: Started a warm pool instance as {instance_name}.")
+                        continue
+                    logging.info(f"Scaling out: Launching new App Tier instance ({instance_name})...")
+                    await run_aws(launch_app_instance, instance_name)
+                    await asyncio.sleep(2)
 
-            # Scale in: terminate instances down to target (possibly 0)
+            # Scale in: stop instances into the warm pool (while it has room) or terminate them, down to target (possibly 0).
+            # Instances still booting are removed first and always terminated: stopping one could interrupt its
+            # first-boot user data (which doesn't run again), leaving a pool instance that never serves
             elif current_instance_count > target_instances:
                 instances_to_terminate = current_instance_count - target_instances
-                logging.info(f"Scaling in: Terminating {instances_to_terminate} App Tier instance(s)...")
-                for instance_id in list(running_app_instances):
-                    if len(running_app_instances) > target_instances:
-                        terminate_app_instance(instance_id)
+                logging.info(f"Scaling in: Removing {instances_to_terminate} App Tier instance(s)...")
+                pool_instances = await run_aws(get_warm_pool_instances) if WARM_POOL_SIZE > 0 else None
+                pool_room = WARM_POOL_SIZE - len(pool_instances) if pool_instances is not None else 0
+                used_pool_numbers = await run_aws(get_used_app_instance_numbers, WARM_POOL_NAME_PREFIX) if pool_room > 0 else set()
+                for instance_id in sorted(running_app_instances, key=boot_latency.is_booting, reverse=True):
+                    if len(running_app_instances) <= target_instances:
+                        break
+                    if boot_latency.is_booting(instance_id):
+                        await run_aws(terminate_app_instance, instance_id)
                         await asyncio.sleep(2)
+                        continue
+                    pool_name = free_instance_name(WARM_POOL_NAME_PREFIX, used_pool_numbers, WARM_POOL_SIZE + MAX_APP_INSTANCES) if pool_room > 0 else None
+                    if pool_name and await run_aws(stop_app_instance_into_pool, instance_id, pool_name):
+                        pool_room -= 1
                     else:
-                        break
+                        await run_aws(terminate_app_instance, instance_id)
+                    await asyncio.sleep(2)
+
+            await replenish_warm_pool()
 
         except Exception as e:
             logging.error(f"Error in auto-scaling controller: {e}")
         finally:
             await asyncio.sleep(SCALING_CHECK_INTERVAL)
 
-async def response_queue_poller():
+class ResponseDispatcher:
     """
-    Continuously polls the response SQS queue for results and
-    sets the result on the corresponding Future object in pending_requests.
+    Receives classification results from the response queue and resolves the matching
+    futures in pending_requests.
+    Several long-pollers run concurrently (each on its own thread, so their 20 second
+    waits never tie up the AWS I/O pool); a receive returns as soon as a response arrives,
+    so there are no fixed sleeps on the delivery path. Received messages are acknowledged
+    through a delete_message_batch batcher after their futures are resolved.
+    Delivery lag (time from the worker sending a response to the web tier resolving its
+    request) and end-to-end request latency are tracked and reported by metrics().
     """
-    global response_queue_url
-    logging.info("Response queue poller started.")
-    while True:
-        try:
-            if not response_queue_url:
-                response_queue_url = get_queue_url(RESPONSE_SQS_QUEUE_NAME)
+
+    def __init__(self, poller_count=WEB_RESPONSE_POLLERS, wait_time=WEB_RESPONSE_WAIT_TIME, lag_window=WEB_RESPONSE_LAG_WINDOW):
+        self.poller_count = poller_count
+        self.wait_time = wait_time
+        self.executor = ThreadPoolExecutor(max_workers=poller_count, thread_name_prefix='response-poller')
+        self.delete_batcher = None
+        self.release_batcher = None # Returns other processes' responses to the shared queue (see dispatch)
+        self.lags = deque(maxlen=lag_window) # Delivery lag (seconds) of the most recent responses
+        self.delivered_at = deque(maxlen=lag_window) # Delivery times of the most recent responses
+        self.latencies = deque(maxlen=lag_window) # (completed_at, latency) of the most recent requests, from registration to result
+        self.first_responses = {} # App Tier instance ID -> time of its first response since the last publish_web_stats()
+        self.first_responses_lock = threading.Lock()
+        # Counters for monitoring
+        self.receive_calls = 0
+        self.empty_receives = 0
+        self.received = 0
+        self.delivered = 0
+        self.unknown = 0
+        self.released = 0
+        self.malformed = 0
+        self.max_lag = 0.0
+
+    def start(self):
+        """Starts the long-pollers on the running event loop."""
+        for index in range(self.poller_count):
+            asyncio.create_task(self.poll_loop(index))
+
+    async def receive(self, queue_url):
+        """Long-polls the response queue once on a poller thread."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(
+            sqs.receive_message,
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=10,
+            WaitTimeSeconds=self.wait_time,
+            AttributeNames=['SentTimestamp'],
+            MessageAttributeNames=['InstanceId']
+        ))
+
+    def record_lag(self, message):
+        """Records the delivery lag of a response from its SentTimestamp attribute."""
+        sent_timestamp = message.get('Attributes', {}).get('SentTimestamp')
+        if sent_timestamp is None:
+            return
+        lag = max(0.0, time.time() - int(sent_timestamp) / 1000)
+        self.lags.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+
+    def record_latency(self, latency):
+        """Records the end-to-end latency (seconds) of a completed (or expired) request."""
+        self.latencies.append((time.time(), latency))
+
+    def latency_percentile(self, fraction, window=SLO_LATENCY_WINDOW):
+        """Returns a percentile of the request latencies recorded over the last `window` seconds, or None without samples."""
+        cutoff = time.time() - window
+        recent = sorted(latency for completed_at, latency in self.latencies if completed_at >= cutoff)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(fraction * len(recent)))]
+
+    def belongs_to_another_process(self, message):
+        """
+        Tells whether a response for an unknown request ID may be waited for by another web process:
+        only when this process falls back to the shared response queue, and only while the response
+        is younger than the longest a request can wait for its result.
+        """
+        if node_response_queue_url:
+            return False
+        sent_timestamp = message.get('Attributes', {}).get('SentTimestamp')
+        if sent_timestamp is None:
+            return False
+        return time.time() - int(sent_timestamp) / 1000 < max(WEB_REQUEST_TIMEOUT, WEB_JOB_TIMEOUT)
+
+    def dispatch(self, message):
+        """
+        Resolves the future of the request a response message belongs to.
+        Returns False if the message must be returned to the queue for another web process instead of deleted.
+        """
+        # Expected format: "original_filename,prediction_result,unique_request_id"
+        message_body = message['Body']
+        logging.info(f"Received response message: {message_body}")
+        # The first response from a newly launched instance measures its boot latency
+        # (responses reach every web process, so they are also published for the controller, see publish_web_stats)
+        instance_id = message.get('MessageAttributes', {}).get('InstanceId', {}).get('StringValue')
+        boot_latency.responded(instance_id)
+        if instance_id is not None:
+            with self.first_responses_lock:
+                self.first_responses.setdefault(instance_id, time.time())
+        parts = message_body.split(',', 2) # Split into at most 3 parts
+        if len(parts) != 3:
+            self.malformed += 1
+            logging.error(f"Malformed response SQS message body: {message_body}. Skipping and deleting.")
+            return True
+        original_filename, prediction_result, unique_request_id = parts
+
+        future = pending_requests.pop(unique_request_id, None)
+        pending_deadlines.pop(unique_request_id, None)
+        started_at = pending_started_at.pop(unique_request_id, None)
+        if future is None:
+            if self.belongs_to_another_process(message):
+                return False
+            self.unknown += 1
+            logging.warning(f"Received result for unknown request ID: {unique_request_id} (file: {original_filename}).")
+            return True
+        if future.done():
+            logging.warning(f"Future for {unique_request_id} already done. Message might be duplicate.")
+            return True
+        future.set_result(prediction_result)
+        self.delivered += 1
+        self.delivered_at.append(time.time())
+        self.record_lag(message)
+        if started_at is not None:
+            self.record_latency(time.time() - started_at)
+        logging.info(f"Set result for request {unique_request_id} (file: {original_filename}): {prediction_result}")
+        return True
+
+    def acknowledge(self, message):
+        """Queues a handled (or unusable) response message for batched deletion."""
+        receipt_handle = message['ReceiptHandle']
+        future = self.delete_batcher.submit({'ReceiptHandle': receipt_handle})
+
+        def log_failure(done):
+            if done.exception() is not None:
+                logging.error(f"Failed to delete response message {receipt_handle}: {done.exception()}")
+
+        future.add_done_callback(log_failure)
+
+    def release(self, message):
+        """Makes a response message visible again right away, for the web process waiting for it."""
+        self.released += 1
+        receipt_handle = message['ReceiptHandle']
+        future = self.release_batcher.submit({'ReceiptHandle': receipt_handle, 'VisibilityTimeout': 0})
+
+        def log_failure(done):
+            if done.exception() is not None:
+                logging.error(f"Failed to release response message {receipt_handle}: {done.exception()}")
+
+        future.add_done_callback(log_failure)
+
+    async def poll_loop(self, index):
+        """One long-poller: receives responses and dispatches them until the app stops."""
+        global response_queue_url
+        logging.info(f"Response poller {index} started.")
+        error_backoff = 1
+        while True:
+            try:
                 if not response_queue_url:
-                    logging.error("Response SQS queue URL not found. Retrying in 5 seconds...")
-                    await asyncio.sleep(5)
-                    continue
+                    response_queue_url = await run_aws(get_queue_url, RESPONSE_SQS_QUEUE_NAME)
+                    if not response_queue_url:
+                        logging.error("Response SQS queue URL not found. Retrying in 5 seconds...")
+                        await asyncio.sleep(5)
+                        continue
+                if self.delete_batcher is None:
+                    self.delete_batcher = SqsBatcher(sqs, response_queue_url, 'delete', max_delay=WEB_RESPONSE_DELETE_MAX_DELAY)
+                    self.release_batcher = SqsBatcher(sqs, response_queue_url, 'change_visibility', max_delay=WEB_RESPONSE_DELETE_MAX_DELAY)
 
-            response = sqs.receive_message(
-                QueueUrl=response_queue_url,
-                MaxNumberOfMessages=10, # Fetch up to 10 messages at once
-                WaitTimeSeconds=WEB_TIER_POLLING_INTERVAL # Use configured polling interval for long polling
-            )
+                response = await self.receive(response_queue_url)
+                self.receive_calls += 1
+                messages = response.get('Messages', [])
+                if not messages:
+                    self.empty_receives += 1
+                self.received += len(messages)
+                for message in messages:
+                    try:
+                        if not self.dispatch(message):
+                            self.release(message)
+                            continue
+                    except Exception as parse_e:
+                        self.malformed += 1
+                        logging.error(f"Error processing response SQS message '{message.get('Body')}': {parse_e}. Deleting message.")
+                    self.acknowledge(message)
+                error_backoff = 1
+            except Exception as e:
+                # Only errors back off (up to 30s), so a failing receive doesn't spin
+                logging.error(f"Error in response poller {index}: {e}. Retrying in {error_backoff}s...")
+                await asyncio.sleep(error_backoff)
+                error_backoff = min(30, error_backoff * 2)
 
-            messages = response.get('Messages', [])
-            if not messages:
-                logging.debug("No messages in response queue. Waiting...")
-                await asyncio.sleep(1) # Short sleep if no messages, to avoid busy-waiting
-                continue
+    def take_first_responses(self):
+        """Returns and resets the first response time of every App Tier instance heard from since the previous call."""
+        with self.first_responses_lock:
+            first_responses, self.first_responses = self.first_responses, {}
+        return first_responses
 
-            for message in messages:
-                receipt_handle = message['ReceiptHandle']
-                # Expected format: "original_filename,prediction_result,unique_request_id"
-                message_body = message['Body']
-                logging.info(f"Received response message: {message_body}")
-
-                try:
-                    parts = message_body.split(',', 2) # Split into at most 3 parts
-                    if len(parts) == 3:
-                        original_filename = parts[0]
-                        prediction_result = parts[1]
-                        unique_request_id = parts[2]
-
-                        if unique_request_id in pending_requests:
-                            future = pending_requests.pop(unique_request_id)
-                            if not future.done():
-                                future.set_result(prediction_result)
-                                logging.info(f"Set result for request {unique_request_id} (file: {original_filename}): {prediction_result}")
-                            else:
-                                logging.warning(f"Future for {unique_request_id} already done. Message might be duplicate.")
-                        else:
-                            logging.warning(f"Received result for unknown request ID: {unique_request_id} (file: {original_filename}).")
-                        
-                        # Delete message from queue after processing
-                        sqs.delete_message(QueueUrl=response_queue_url, ReceiptHandle=receipt_handle)
-                        logging.info(f"Deleted response message with ReceiptHandle: {receipt_handle}")
-                    else:
-                        logging.error(f"Malformed response SQS message body: {message_body}. Skipping and deleting.")
-                        # Delete malformed message to prevent re-processing
-                        sqs.delete_message(QueueUrl=response_queue_url, ReceiptHandle=receipt_handle)
+    def service_rate(self, window=WEB_SERVICE_RATE_WINDOW):
+        """Estimates how many responses per second the App Tier delivered over the last `window` seconds."""
+        now = time.time()
+        recent = [delivered_at for delivered_at in self.delivered_at if delivered_at >= now - window]
+        if not recent:
+            return 0.0
+        # A full deque may not reach back to the start of the window; measure over the span it covers
+        span = window
+        if len(self.delivered_at) == self.delivered_at.maxlen and self.delivered_at[0] >= now - window:
+            span = now - recent[0]
+        return len(recent) / max(span, 1.0)
 
-                except Exception as parse_e:
-                    logging.error(f"Error processing response SQS message '{message_body}': {parse_e}. Deleting message.")
-                    sqs.delete_message(QueueUrl=response_queue_url, ReceiptHandle=receipt_handle)
-        
-        except Exception as e:
-            logging.error(f"Error in response queue poller: {e}")
-        finally:
-            # Short sleep to prevent busy-waiting even if polling is quick
-            await asyncio.sleep(1) 
+    def metrics(self):
+        """Returns the dispatcher's counters and delivery-lag statistics (seconds)."""
+        lags = sorted(self.lags)
+
+        def percentile(fraction):
+            if not lags:
+                return None
+            return lags[min(len(lags) - 1, int(fraction * len(lags)))]
+
+        metrics = {
+            'pollers': self.poller_count,
+            'receive_calls': self.receive_calls,
+            'empty_receives': self.empty_receives,
+            'received': self.received,
+            'delivered': self.delivered,
+            'unknown_request_ids': self.unknown,
+            'released_to_other_processes': self.released,
+            'malformed': self.malformed,
+            'pending_requests': len(pending_requests),
+            'service_rate': self.service_rate(),
+            'latency': {
+                'p50': self.latency_percentile(0.50),
+                'p95': self.latency_percentile(0.95),
+                'p99': self.latency_percentile(0.99),
+            },
+            'delivery_lag': {
+                'samples': len(lags),
+                'mean': sum(lags) / len(lags) if lags else None,
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': self.max_lag,
+            },
+        }
+        if self.delete_batcher is not None:
+            metrics['deletes'] = {
+                'acknowledged': self.delete_batcher.entries_sent,
+                'api_calls': self.delete_batcher.api_calls,
+                'failed': self.delete_batcher.failed_entries,
+            }
+        return metrics
+
+response_dispatcher = ResponseDispatcher()
 
 
 @app.on_event("startup")
 async def startup_event():
     """On startup, ensure SQS queue URLs are known and start background tasks."""
-    global request_queue_url, response_queue_url
+    global request_queue_url, response_queue_url, node_response_queue_url, request_batcher
     logging.info("FastAPI app starting up.")
     
     # Get request and response queue URLs
-    request_queue_url = get_queue_url(SQS_QUEUE_NAME)
-    response_queue_url = get_queue_url(RESPONSE_SQS_QUEUE_NAME)
+    request_queue_url = await run_aws(get_queue_url, SQS_QUEUE_NAME)
+    if WEB_PER_NODE_RESPONSE_QUEUES:
+        node_response_queue_url = await run_aws(create_node_response_queue)
+    if node_response_queue_url:
+        response_queue_url = node_response_queue_url
+    else:
+        if WEB_PER_NODE_RESPONSE_QUEUES:
+            logging.warning("Falling back to the shared response queue; responses for other web processes are returned to it instead of deleted.")
+        response_queue_url = await run_aws(get_queue_url, RESPONSE_SQS_QUEUE_NAME)
 
     if not request_queue_url:
         logging.error("Failed to get request SQS queue URL on startup.")
+    else:
+        request_batcher = SqsBatcher(sqs, request_queue_url, 'send', max_delay=WEB_ENQUEUE_BATCH_WINDOW, flush_threads=WEB_ENQUEUE_FLUSH_THREADS)
     if not response_queue_url:
         logging.error("Failed to get response SQS queue URL on startup.")
 
-    get_app_tier_security_group_id() # Attempt to get App Tier SG ID
+    await run_aws(get_app_tier_security_group_id) # Attempt to get App Tier SG ID
 
     # Start background tasks
     asyncio.create_task(auto_scaling_controller())
-    asyncio.create_task(response_queue_poller())
-    logging.info("Auto-scaling controller and response queue poller scheduled.")
+    response_dispatcher.start()
+    asyncio.create_task(pending_request_janitor())
+    asyncio.create_task(cancellation_publisher_loop())
+    logging.info(f"Auto-scaling controller and {response_dispatcher.poller_count} response poller(s) scheduled.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """On shutdown, removes this web node's response queue, cancelled set and published stats."""
+    await run_aws(delete_web_stats)
+    await run_aws(cancellation_publisher.delete)
+    if node_response_queue_url:
+        await run_aws(delete_node_response_queue, node_response_queue_url)
 
 @app.get("/")
 async def health_check():
@@ -403,63 +959,612 @@ async def health_check():
     """
     return PlainTextResponse("Web Tier is running.")
 
-@app.post("/upload", response_class=PlainTextResponse)
-async def upload_image(myfile: UploadFile = File(...)):
+@app.get("/metrics")
+async def metrics():
     """
-    Handles image uploads, stores them in S3, sends a message to the request SQS queue,
-    and awaits the result from the response SQS queue.
+    Reports response delivery metrics (lag from the worker's send to the request being resolved),
+    result cache statistics, admission control counters and the autoscaler's rate estimates.
+    """
+    return {
+        'node': {'id': NODE_ID, 'pid': os.getpid(), 'own_response_queue': bool(node_response_queue_url), 'autoscaler': autoscaler_lock_file is not None},
+        'responses': response_dispatcher.metrics(),
+        'result_cache': {'size': len(result_cache), 'hits': result_cache.hits, 'misses': result_cache.misses},
+        'admission': dict(admission_stats, in_flight=in_flight_uploads, max_in_flight=WEB_MAX_IN_FLIGHT, request_queue_depth=latest_request_queue_depth),
+        'jobs': {'running': len(running_jobs), 'stored': len(job_store)},
+        'autoscaling': dict(
+            scaling_policy.state(),
+            policy=scaling_policy.name,
+            arrival_rate=arrival_tracker.rate(WEB_SERVICE_RATE_WINDOW),
+            boot_latency=boot_latency.latency,
+            boot_latency_samples=boot_latency.samples,
+            booting_instances=boot_latency.booting(),
+        ),
+        'enqueue': {
+            'sent': request_batcher.entries_sent,
+            'api_calls': request_batcher.api_calls,
+            'failed': request_batcher.failed_entries,
+        } if request_batcher else None,
+        'cancellation': {'published_ids': len(cancellation_publisher.cancelled), 'cancellations': cancellation_publisher.cancellations, 'publishes': cancellation_publisher.publishes},
+    }
+
+def request_routing(deadline):
+    """
+    Returns the routing fields of a request message: its deadline, this node's ID (which names the cancelled set
+    workers watch for it) and, with a per-node response queue, the reply address.
+    """
+    if node_response_queue_url:
+        return {'deadline': deadline, 'reply_to': node_response_queue_url, 'node': NODE_ID}
+    return {'deadline': deadline, 'node': NODE_ID}
+
+async def prepare_request_message(original_filename, file_content, deadline):
+    """
+    Builds the request message for an image and returns (unique_request_id, message_body).
+    Images of at most WEB_INLINE_IMAGE_MAX_BYTES travel inside the message (base64-encoded);
+    larger ones, or ones whose message would exceed SQS's size limit, are uploaded to the
+    S3 input bucket here and referenced by key.
+    The deadline (epoch seconds) travels in the message so workers skip the request if it's still queued by then.
     """
     content_type = "image/jpeg"
 
-    original_filename = myfile.filename
     # Generate a unique ID for this specific request, combining with original filename for traceability
     # This ID will be used to match the response later.
     unique_request_id = f"{os.path.splitext(original_filename)[0]}-{uuid.uuid4()}" 
     
     # Generate a unique S3 input key using UUID to prevent collisions
     # This is for the input bucket, as App Tier will download using this key
+    # (inline images aren't stored in S3; the key then only names the image on the App Tier)
     unique_input_s3_key = f"{uuid.uuid4()}-{original_filename}"
 
+    # Message body contains unique_input_s3_key, original_filename, and unique_request_id (see message_protocol.py)
+    # The App Tier will use original_filename and unique_request_id when sending to response SQS.
+    message_body = None
+    if len(file_content) <= WEB_INLINE_IMAGE_MAX_BYTES:
+        message_body = encode_request(unique_input_s3_key, original_filename, unique_request_id, image_bytes=file_content, **request_routing(deadline))
+        if not fits_in_message(message_body):
+            message_body = None
+    if message_body is None:
+        # Upload image to S3 input bucket
+        await run_aws(s3.put_object, Bucket=S3_INPUT_BUCKET, Key=unique_input_s3_key, Body=file_content, ContentType=content_type)
+        logging.info(f"Uploaded {original_filename} to S3 as {unique_input_s3_key}")
+        message_body = encode_request(unique_input_s3_key, original_filename, unique_request_id, **request_routing(deadline))
+    else:
+        logging.info(f"Sending {original_filename} ({len(file_content)} bytes) inline in the request message.")
+    return unique_request_id, message_body
+
+def register_pending_request(unique_request_id, future_result, deadline):
+    """
+    Registers a request's future so the response dispatcher can resolve it (or the janitor fail it
+    once the deadline passes). Done before sending, so a fast response can't arrive for an unknown request ID.
+    """
+    pending_requests[unique_request_id] = future_result
+    pending_deadlines[unique_request_id] = deadline
+    pending_started_at[unique_request_id] = time.time()
+    arrival_tracker.record()
+    logging.info(f"Added request {unique_request_id} to pending_requests.")
+
+def unregister_pending_request(unique_request_id):
+    """Forgets a request whose message couldn't be sent."""
+    pending_requests.pop(unique_request_id, None)
+    pending_deadlines.pop(unique_request_id, None)
+    pending_started_at.pop(unique_request_id, None)
+
+async def enqueue_request_message(message_body):
+    """
+    Sends a request message through the enqueue coalescer: messages sent within WEB_ENQUEUE_BATCH_WINDOW
+    of each other share one send_message_batch call (up to 10 entries / 256 KB).
+    Returns once SQS acknowledged this message; raises if SQS rejected it (after the batcher's retries).
+    """
+    return await asyncio.wrap_future(request_batcher.submit({'MessageBody': message_body}))
+
+async def submit_classification_request(original_filename, file_content, future_result, deadline):
+    """
+    Sends a request message for an image to the request SQS queue (see prepare_request_message).
+    future_result is registered in pending_requests and resolved by the response dispatcher,
+    or failed by the janitor once the deadline (epoch seconds) passes.
+    """
+    unique_request_id, message_body = await prepare_request_message(original_filename, file_content, deadline)
+    register_pending_request(unique_request_id, future_result, deadline)
+    try:
+        await enqueue_request_message(message_body)
+        logging.info(f"Sent request {unique_request_id} to request SQS queue for {original_filename}.")
+    except BaseException as e:
+        unregister_pending_request(unique_request_id)
+        if isinstance(e, asyncio.CancelledError):
+            # The batcher may still send the message: make workers skip it
+            cancellation_publisher.cancel(unique_request_id)
+        raise
+    return unique_request_id
+
+async def submit_classification_requests(uploads, deadline):
+    """
+    submit_classification_request for many images at once.
+    uploads: list of (original_filename, file_content, future_result).
+    S3 uploads of large images run concurrently, and the enqueue coalescer packs the
+    messages into send_message_batch calls.
+    Returns the request ID of every upload (None where the request couldn't be sent; its future is failed).
+    """
+    results = await asyncio.gather(
+        *(submit_classification_request(original_filename, file_content, future_result, deadline) for original_filename, file_content, future_result in uploads),
+        return_exceptions=True
+    )
+    request_ids = []
+    for (original_filename, _, future_result), result in zip(uploads, results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to submit request for {original_filename}: {result}")
+            if not future_result.done():
+                future_result.set_exception(result)
+            result = None
+        request_ids.append(result)
+    return request_ids
+
+def expire_request(unique_request_id):
+    """
+    Stops waiting for a request past its deadline: removes it from pending_requests and fails its future
+    (and with it any uploads coalesced onto it) with asyncio.TimeoutError.
+    A late response for it is then discarded (and deleted) by the response dispatcher.
+    """
+    future_result = pending_requests.pop(unique_request_id, None)
+    pending_deadlines.pop(unique_request_id, None)
+    started_at = pending_started_at.pop(unique_request_id, None)
+    if future_result is not None and not future_result.done():
+        admission_stats['expired'] += 1
+        # An expired request took at least this long; counting it keeps the latency percentiles honest
+        if started_at is not None:
+            response_dispatcher.record_latency(time.time() - started_at)
+        future_result.set_exception(asyncio.TimeoutError(f"Request {unique_request_id} passed its deadline."))
+        cancellation_publisher.cancel(unique_request_id)
+        logging.warning(f"Request {unique_request_id} passed its deadline without a result. Expired it.")
+
+def cancel_request(unique_request_id):
+    """
+    Cancels a request nobody waits for anymore (every client uploading the image disconnected or gave up):
+    removes it from pending_requests, cancels its future and publishes the cancellation so
+    workers skip the request instead of classifying it for nobody.
+    """
+    future_result = pending_requests.pop(unique_request_id, None)
+    pending_deadlines.pop(unique_request_id, None)
+    pending_started_at.pop(unique_request_id, None)
+    if future_result is not None and not future_result.done():
+        admission_stats['cancelled'] += 1
+        future_result.cancel()
+    cancellation_publisher.cancel(unique_request_id)
+    logging.info(f"Cancelled request {unique_request_id}: no client is waiting for it anymore.")
+
+async def cancellation_publisher_loop():
+    """Publishes the recently cancelled request set to the App Tier whenever it changes."""
+    logging.info("Cancellation publisher started.")
+    while True:
+        await asyncio.sleep(WEB_CANCELLATION_PUBLISH_INTERVAL)
+        try:
+            await run_aws(cancellation_publisher.publish)
+        except Exception as e:
+            logging.error(f"Error in cancellation publisher: {e}")
+
+async def pending_request_janitor():
+    """Periodically expires pending requests whose deadline passed (e.g., because their upload handler went away)."""
+    logging.info("Pending request janitor started.")
+    while True:
+        await asyncio.sleep(WEB_JANITOR_INTERVAL)
+        now = time.time()
+        for unique_request_id, deadline in list(pending_deadlines.items()):
+            if deadline <= now:
+                expire_request(unique_request_id)
 
+def estimate_retry_after():
+    """
+    Estimates how many seconds a rejected client should wait before retrying:
+    the time the App Tier needs to work through the current backlog at its recent service rate,
+    clamped to 1..WEB_MAX_RETRY_AFTER.
+    """
+    backlog = max(latest_request_queue_depth, len(pending_requests))
+    service_rate = response_dispatcher.service_rate()
+    if service_rate <= 0:
+        return WEB_MAX_RETRY_AFTER
+    return max(1, min(WEB_MAX_RETRY_AFTER, math.ceil(backlog / service_rate)))
+
+async def store_duplicate_result(original_filename, prediction_result):
+    """
+    Writes the result of a cache hit or coalesced request to the S3 output bucket,
+    as the App Tier does for every request it processes.
+    """
+    output_s3_key_base = os.path.splitext(original_filename)[0]
+    try:
+        await run_aws(s3.put_object, Bucket=S3_OUTPUT_BUCKET, Key=output_s3_key_base, Body=f"({output_s3_key_base}, {prediction_result})".encode('utf-8'))
+    except Exception as e:
+        logging.error(f"Error uploading duplicate result for {output_s3_key_base} to S3: {e}")
+
+def finish_in_flight_request(content_hash, future_result):
+    """Done-callback of an in-flight request: caches its result and stops coalescing onto it."""
+    if in_flight_by_hash.get(content_hash) is future_result:
+        del in_flight_by_hash[content_hash]
+        in_flight_waiters.pop(content_hash, None)
+        in_flight_request_ids.pop(content_hash, None)
+    if future_result.cancelled():
+        return
+    if future_result.exception() is None:
+        result_cache.put(content_hash, future_result.result())
+
+async def wait_for_in_flight_result(content_hash, future_result, deadline):
+    """
+    Waits, until the deadline, for the result of an in-flight request shared by identical uploads.
+    When the last upload waiting on the request stops waiting (its client disconnected or it timed out)
+    before a result arrived, the request is cancelled.
+    """
+    in_flight_waiters[content_hash] = in_flight_waiters.get(content_hash, 0) + 1
+    try:
+        # Shield the shared future so a cancelled waiter doesn't cancel it for everyone else
+        return await asyncio.wait_for(asyncio.shield(future_result), max(0, deadline - time.time()))
+    finally:
+        if in_flight_by_hash.get(content_hash) is future_result:
+            in_flight_waiters[content_hash] -= 1
+            unique_request_id = in_flight_request_ids.get(content_hash)
+            if in_flight_waiters[content_hash] == 0 and not future_result.done() and unique_request_id:
+                cancel_request(unique_request_id)
+
+def abandon_in_flight_request(future_result, reason):
+    """
+    Fails the shared future of an in-flight request whose submission was cut short (e.g., the client
+    disconnected while its image was being sent), so it doesn't stay in in_flight_by_hash unresolved.
+    If the request was registered, it is removed from pending_requests and its cancellation published.
+    """
+    for unique_request_id in [request_id for request_id, future in pending_requests.items() if future is future_result]:
+        unregister_pending_request(unique_request_id)
+        cancellation_publisher.cancel(unique_request_id)
+    if not future_result.done():
+        future_result.set_exception(RuntimeError(reason))
+
+def start_in_flight_request(content_hash):
+    """Creates and registers the shared future of a new in-flight request for an image's content."""
+    loop = asyncio.get_event_loop()
+    future_result = loop.create_future()
+    in_flight_by_hash[content_hash] = future_result
+    in_flight_waiters[content_hash] = 0
+    future_result.add_done_callback(lambda future: finish_in_flight_request(content_hash, future))
+    return future_result
+
+async def use_cached_result(original_filename, prediction_result):
+    """Answers an upload from the result cache."""
+    logging.info(f"Result cache hit for {original_filename}: {prediction_result}")
+    await store_duplicate_result(original_filename, prediction_result)
+    return prediction_result
+
+async def wait_for_duplicate_result(original_filename, content_hash, future_result, deadline):
+    """Answers an upload with the result of an identical request already in flight."""
+    logging.info(f"Identical image already in flight; {original_filename} will share its result.")
+    prediction_result = await wait_for_in_flight_result(content_hash, future_result, deadline)
+    await store_duplicate_result(original_filename, prediction_result)
+    return prediction_result
+
+async def classify_image(original_filename, file_content, deadline):
+    """
+    Returns the prediction for an uploaded image.
+    Images whose bytes were classified recently are served from the result cache, and
+    uploads identical to a request still in flight wait for that request's result;
+    only new content is uploaded to S3 and enqueued for the App Tier.
+    Raises asyncio.TimeoutError if no result arrives before the deadline (epoch seconds).
+    """
+    content_hash = hashlib.sha256(file_content).hexdigest()
+
+    prediction_result = result_cache.get(content_hash)
+    if prediction_result is not None:
+        return await use_cached_result(original_filename, prediction_result)
+
+    future_result = in_flight_by_hash.get(content_hash)
+    if future_result is not None:
+        return await wait_for_duplicate_result(original_filename, content_hash, future_result, deadline)
+
+    # Create a Future object for this request and store it
+    future_result = start_in_flight_request(content_hash)
+    try:
+        unique_request_id = await submit_classification_request(original_filename, file_content, future_result, deadline)
+    except asyncio.CancelledError:
+        # Cancelled mid-submit (the client disconnected): fail the uploads that attached to this one
+        abandon_in_flight_request(future_result, f"Request for {original_filename} was abandoned before it was sent.")
+        raise
+    except Exception as e:
+        # Fail the requests that attached to this one as well
+        if not future_result.done():
+            future_result.set_exception(e)
+        raise
+
+    in_flight_request_ids[content_hash] = unique_request_id
+
+    # Await the result from the response dispatcher until the deadline
+    return await wait_for_in_flight_result(content_hash, future_result, deadline)
+
+async def wait_for_disconnect(request):
+    """Returns once the client of an HTTP request has disconnected."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(WEB_DISCONNECT_CHECK_INTERVAL)
+
+async def classify_until_disconnect(request, original_filename, file_content, deadline):
+    """
+    Runs classify_image while watching the client's connection. If the client disconnects first,
+    the classification is abandoned (which cancels the request if no identical upload still waits
+    for it) and HTTPException 499 is raised; there is nobody left to send it to.
+    """
+    classification = asyncio.ensure_future(classify_image(original_filename, file_content, deadline))
+    disconnect_watch = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({classification, disconnect_watch}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect_watch.cancel()
+        if not classification.done():
+            classification.cancel()
+    if not classification.done() or classification.cancelled():
+        admission_stats['disconnected'] += 1
+        logging.warning(f"Client uploading {original_filename} disconnected before its result was ready.")
+        raise HTTPException(status_code=499, detail="Client disconnected.")
+    return classification.result()
+
+@app.post("/upload", response_class=PlainTextResponse)
+async def upload_image(request: Request, myfile: UploadFile = File(...), timeout: float = None):
+    """
+    Handles image uploads, stores them in S3, sends a message to the request SQS queue,
+    and awaits the result from the response SQS queue.
+    Repeated images are answered from the result cache or coalesced with an identical in-flight request.
+    Uploads beyond WEB_MAX_IN_FLIGHT are rejected with 429 and a Retry-After estimate;
+    uploads without a result within `timeout` seconds (at most WEB_REQUEST_TIMEOUT) fail with 504.
+    If the client disconnects while waiting, its request is cancelled on the App Tier as well.
+    """
+    global in_flight_uploads
+    original_filename = myfile.filename
+
+    if in_flight_uploads >= WEB_MAX_IN_FLIGHT:
+        admission_stats['rejected'] += 1
+        retry_after = estimate_retry_after()
+        logging.warning(f"Rejecting upload of {original_filename}: {in_flight_uploads} uploads in flight. Retry after {retry_after}s.")
+        raise HTTPException(status_code=429, detail="Too many requests in flight.", headers={'Retry-After': str(retry_after)})
+
+    timeout = WEB_REQUEST_TIMEOUT if timeout is None else max(0.0, min(timeout, WEB_REQUEST_TIMEOUT))
+    deadline = time.time() + timeout
+    in_flight_uploads += 1
     try:
-        # Upload image to S3 input bucket
         file_content = await myfile.read()
-        s3.put_object(Bucket=S3_INPUT_BUCKET, Key=unique_input_s3_key, Body=file_content, ContentType=content_type)
-        logging.info(f"Uploaded {original_filename} to S3 as {unique_input_s3_key}")
 
         # Ensure queue URLs are available
         if not request_queue_url:
             raise HTTPException(status_code=500, detail="Request SQS queue URL not found.")
 
-        # Message body contains unique_input_s3_key, original_filename, and unique_request_id
-        # The App Tier will use original_filename and unique_request_id when sending to response SQS.
-        message_body = f"{unique_input_s3_key},{original_filename},{unique_request_id}"
-        sqs.send_message(
-            QueueUrl=request_queue_url,
-            MessageBody=message_body
-        )
-        logging.info(f"Sent message '{message_body}' to request SQS queue for {original_filename}.")
-
-        # Create a Future object for this request and store it
-        loop = asyncio.get_event_loop()
-        future_result = loop.create_future()
-        pending_requests[unique_request_id] = future_result
-        logging.info(f"Added request {unique_request_id} to pending_requests.")
-
-        # Await the result from the response queue poller indefinitely (no timeout)
-        prediction_result = await future_result
+        prediction_result = await classify_until_disconnect(request, original_filename, file_content, deadline)
         
         logging.info(f"Returning prediction for {original_filename}: {prediction_result}")
         return PlainTextResponse(prediction_result)
 
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        admission_stats['timed_out'] += 1
+        logging.error(f"No result for {original_filename} within {timeout:.0f}s.")
+        raise HTTPException(status_code=504, detail=f"No classification result within {timeout:.0f} seconds.")
     except Exception as e: # Catch all exceptions, including cancelled futures if the app shuts down
         logging.error(f"Error processing upload for {original_filename}: {e}")
-        # Clean up pending request if an error occurs before awaiting result
-        if unique_request_id in pending_requests:
-            del pending_requests[unique_request_id]
         # Depending on the type of error, you might want to return a different HTTPException status code
         if isinstance(e, asyncio.CancelledError):
             raise HTTPException(status_code=500, detail="Request processing cancelled (e.g., server shutdown).")
         else:
             raise HTTPException(status_code=500, detail=f"Failed to process image upload: {e}")
+    finally:
+        in_flight_uploads -= 1
+
+async def batch_item_result(index, original_filename, awaitable):
+    """Awaits the result of one image of a batch upload and returns its NDJSON record."""
+    try:
+        return {'index': index, 'filename': original_filename, 'result': await awaitable}
+    except asyncio.TimeoutError:
+        admission_stats['timed_out'] += 1
+        return {'index': index, 'filename': original_filename, 'error': 'No classification result before the deadline.', 'status': 504}
+    except Exception as e:
+        logging.error(f"Error processing batch upload of {original_filename}: {e}")
+        return {'index': index, 'filename': original_filename, 'error': f"Failed to process image upload: {e}", 'status': 500}
+
+def reserve_in_flight_uploads(count):
+    """Counts `count` uploads as in flight and returns a function that releases them (only the first call does)."""
+    global in_flight_uploads
+    in_flight_uploads += count
+    reservation = {'count': count}
 
+    def release():
+        global in_flight_uploads
+        in_flight_uploads -= reservation['count']
+        reservation['count'] = 0
+    return release
+
+async def stream_batch_results(uploads, deadline, release_uploads):
+    """
+    Classifies the images of a batch upload and yields one NDJSON line per image, in completion order.
+    uploads: list of (original_filename, file_content).
+    release_uploads: releases the batch's in-flight slots, reserved by upload_batch (see reserve_in_flight_uploads).
+    Cached and in-flight images are answered as in classify_image; all new images are enqueued
+    together (see submit_classification_requests). If the client disconnects, the stream is
+    cancelled and so are the requests nobody else waits for.
+    """
+    tasks = []
+    to_submit = [] # (original_filename, file_content, future_result, content_hash)
+    submitted = False
+    try:
+        for index, (original_filename, file_content) in enumerate(uploads):
+            content_hash = hashlib.sha256(file_content).hexdigest()
+            prediction_result = result_cache.get(content_hash)
+            if prediction_result is not None:
+                awaitable = use_cached_result(original_filename, prediction_result)
+            elif content_hash in in_flight_by_hash:
+                # Also catches repeats of an image earlier in the same batch
+                awaitable = wait_for_duplicate_result(original_filename, content_hash, in_flight_by_hash[content_hash], deadline)
+            else:
+                future_result = start_in_flight_request(content_hash)
+                to_submit.append((original_filename, file_content, future_result, content_hash))
+                awaitable = wait_for_in_flight_result(content_hash, future_result, deadline)
+            tasks.append(asyncio.ensure_future(batch_item_result(index, original_filename, awaitable)))
+
+        if to_submit:
+            request_ids = await submit_classification_requests([upload[:3] for upload in to_submit], deadline)
+            for (_, _, _, content_hash), unique_request_id in zip(to_submit, request_ids):
+                if unique_request_id:
+                    in_flight_request_ids[content_hash] = unique_request_id
+        submitted = True
+
+        for completed in asyncio.as_completed(tasks):
+            yield json.dumps(await completed) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        if not submitted:
+            # The stream was cancelled while its new images were being sent
+            for original_filename, _, future_result, _ in to_submit:
+                abandon_in_flight_request(future_result, f"Request for {original_filename} was abandoned before it was sent.")
+        release_uploads()
+
+@app.post("/upload_batch")
+async def upload_batch(files: List[UploadFile] = File(...), timeout: float = None):
+    """
+    Handles a multipart upload of many images (repeated "files" fields) in one request.
+    The images are enqueued with batched S3/SQS calls and the response streams one JSON object per line
+    (application/x-ndjson) as each classification completes, in completion order:
+        {"index": <position in the upload>, "filename": ..., "result": <label>}
+    or, for an image that failed, {"index": ..., "filename": ..., "error": ..., "status": <504 or 500>}.
+    Batches of more than WEB_MAX_BATCH_FILES images get 413; batches that would take the web tier
+    past WEB_MAX_IN_FLIGHT get 429 with a Retry-After estimate.
+    """
+    if not request_queue_url:
+        raise HTTPException(status_code=500, detail="Request SQS queue URL not found.")
+    if len(files) > WEB_MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {WEB_MAX_BATCH_FILES} files per batch.")
+    if in_flight_uploads + len(files) > WEB_MAX_IN_FLIGHT:
+        admission_stats['rejected'] += len(files)
+        retry_after = estimate_retry_after()
+        logging.warning(f"Rejecting batch upload of {len(files)} file(s): {in_flight_uploads} uploads in flight. Retry after {retry_after}s.")
+        raise HTTPException(status_code=429, detail="Too many requests in flight.", headers={'Retry-After': str(retry_after)})
+
+    # Reserve the batch's slots before the first await, so concurrent batches can't all pass the check above
+    release_uploads = reserve_in_flight_uploads(len(files))
+    try:
+        timeout = WEB_REQUEST_TIMEOUT if timeout is None else max(0.0, min(timeout, WEB_REQUEST_TIMEOUT))
+        deadline = time.time() + timeout
+        uploads = [(upload.filename, await upload.read()) for upload in files]
+        logging.info(f"Received batch upload of {len(uploads)} file(s).")
+        results = stream_batch_results(uploads, deadline, release_uploads)
+    except BaseException:
+        release_uploads()
+        raise
+    # The stream releases the slots when it ends; if the response never starts it, they are released once it is discarded
+    weakref.finalize(results, release_uploads)
+    return StreamingResponse(results, media_type='application/x-ndjson')
+
+def find_job(job_id):
+    """Returns a running or finished (not yet expired) job, or None."""
+    job = running_jobs.get(job_id)
+    if job is None:
+        job = job_store.get(job_id)
+    return job
+
+def job_record(job):
+    """Returns the public JSON representation of a job."""
+    record = {'id': job['id'], 'filename': job['filename'], 'status': job['status'], 'created': job['created']}
+    for field in ('result', 'error', 'completed'):
+        if field in job:
+            record[field] = job[field]
+    return record
+
+async def run_job(job, file_content, deadline):
+    """Classifies a job's image in the background and moves the job to the job store when it finishes."""
+    try:
+        job['result'] = await classify_image(job['filename'], file_content, deadline)
+        job['status'] = 'done'
+    except asyncio.TimeoutError:
+        job['status'] = 'failed'
+        job['error'] = 'No classification result before the deadline.'
+    except Exception as e:
+        logging.error(f"Job {job['id']} ({job['filename']}) failed: {e}")
+        job['status'] = 'failed'
+        job['error'] = f"Failed to process image upload: {e}"
+    finally:
+        if job['status'] == 'pending':
+            job['status'] = 'failed'
+            job['error'] = 'Job cancelled (e.g., server shutdown).'
+        job['completed'] = time.time()
+        running_jobs.pop(job['id'], None)
+        job_store.put(job['id'], job)
+        job['done'].set()
+
+@app.post("/jobs", status_code=202)
+async def create_job(myfile: UploadFile = File(...), timeout: float = None):
+    """
+    Submits an image for classification and returns its job right away (202), without waiting for the result:
+        {"id": ..., "filename": ..., "status": "pending", "created": ...}
+    The result is fetched with GET /jobs/{id} or streamed with GET /jobs/stream.
+    Jobs wait at most `timeout` seconds (at most WEB_JOB_TIMEOUT) for a result; more than
+    WEB_MAX_PENDING_JOBS unfinished jobs get 429 with a Retry-After estimate.
+    """
+    if not request_queue_url:
+        raise HTTPException(status_code=500, detail="Request SQS queue URL not found.")
+    if len(running_jobs) >= WEB_MAX_PENDING_JOBS:
+        admission_stats['rejected'] += 1
+        retry_after = estimate_retry_after()
+        logging.warning(f"Rejecting job for {myfile.filename}: {len(running_jobs)} jobs pending. Retry after {retry_after}s.")
+        raise HTTPException(status_code=429, detail="Too many pending jobs.", headers={'Retry-After': str(retry_after)})
+
+    timeout = WEB_JOB_TIMEOUT if timeout is None else max(0.0, min(timeout, WEB_JOB_TIMEOUT))
+    file_content = await myfile.read()
+    job = {
+        'id': str(uuid.uuid4()),
+        'filename': myfile.filename,
+        'status': 'pending',
+        'created': time.time(),
+        'done': asyncio.Event(),
+    }
+    running_jobs[job['id']] = job
+    asyncio.create_task(run_job(job, file_content, time.time() + timeout))
+    logging.info(f"Created job {job['id']} for {myfile.filename}.")
+    return job_record(job)
+
+@app.get("/jobs/stream")
+async def stream_jobs(ids: str):
+    """
+    Streams the results of a set of jobs (comma-separated `ids`) as server-sent events, in completion order.
+    Every job produces one "result" event whose data is its JSON record (status "unknown" for IDs that
+    don't exist or expired); idle periods are filled with keep-alive comments. The stream ends
+    once every job has been reported.
+    """
+    job_ids = list(dict.fromkeys(job_id.strip() for job_id in ids.split(',') if job_id.strip()))
+
+    async def events():
+        waits = {}
+        try:
+            for job_id in job_ids:
+                job = find_job(job_id)
+                if job is None:
+                    yield f"event: result\ndata: {json.dumps({'id': job_id, 'status': 'unknown'})}\n\n"
+                elif job['done'].is_set():
+                    yield f"event: result\ndata: {json.dumps(job_record(job))}\n\n"
+                else:
+                    waits[asyncio.ensure_future(job['done'].wait())] = job
+            while waits:
+                done, _ = await asyncio.wait(waits, timeout=WEB_SSE_KEEPALIVE_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    yield ": keep-alive\n\n"
+                for wait in done:
+                    yield f"event: result\ndata: {json.dumps(job_record(waits.pop(wait)))}\n\n"
+        finally:
+            for wait in waits:
+                wait.cancel()
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Returns a job's JSON record. With `wait` (seconds, at most WEB_JOB_MAX_WAIT) the call long-polls:
+    it returns as soon as the job finishes, or with status "pending" once the wait is over.
+    Unknown or expired jobs get 404.
+    """
+    job = find_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (unknown or expired).")
+    wait = max(0.0, min(wait, WEB_JOB_MAX_WAIT))
+    if wait and not job['done'].is_set():
+        try:
+            await asyncio.wait_for(job['done'].wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+    return job_record(job)